@@ -0,0 +1,206 @@
+"""Schedule many timetables from the command line, without the web app.
+
+Usage::
+
+    python batch_schedule.py INPUT [INPUT ...] --output DIR [--workers N]
+                             [--format json|csv|both] [--regulation GB|EU] ...
+
+Every ``.csv``/``.json`` timetable found in the inputs (see
+``timetable_files``) is scheduled on a process pool with the same
+``schedule_buses`` and ``get_breaks_for_bus`` used by ``/generate``. For
+each file ``<name>.json`` and/or ``<name>.csv`` are written to the output
+directory, where ``<name>`` is the file's path relative to the input
+directory it was found in, plus a ``summary.json`` listing the fleet size
+and wall time of every file. Inputs that would write the same result file
+are rejected before anything is scheduled.
+
+Only the scheduling core is imported (no Flask, no templates), and the SRT
+database is opened read-only from its memory-mapped snapshot, so start-up
+stays cheap. Unlike ``/generate``, runs are not fed back into the SRT
+database, keeping nightly results reproducible.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from scheduler import (ASSIGNMENT_STRATEGIES, FIRST_FIT, MAX_LOOKAHEAD, SCORED_LOOKAHEAD, SRT_DEADHEAD_PERCENTILE,
+                       ScheduleConfig, get_breaks_for_bus, schedule_buses)
+from srt_database import SRTDatabase
+from timetable_files import find_timetables, load_runs
+
+FORMATS = ('json', 'csv', 'both')
+
+# Base name of the run summary written next to the results
+SUMMARY_NAME = 'summary'
+
+CSV_FIELDS = ('bus_id', 'run_id', 'section', 'start', 'end', 'from_stop', 'to_stop', 'duration_minutes')
+
+# Per-process SRT database, opened by the pool initializer
+_srt: Optional[SRTDatabase] = None
+
+
+def _init_worker(database_file: str):
+    global _srt
+    _srt = SRTDatabase(database_file)
+
+
+def output_names(paths: List[str]) -> Dict[str, str]:
+    """Result name of every timetable in ``paths``, keyed by file.
+
+    Names are relative to the directory argument a file was found in (the
+    base name for files given directly), without the extension. Raises
+    ValueError when two files would get the same name or one would
+    overwrite ``summary.json``.
+    """
+    names: Dict[str, str] = {}
+    owners: Dict[str, str] = {}
+    for root in paths:
+        base = root if os.path.isdir(root) else os.path.dirname(root)
+        for path in find_timetables([root]):
+            if path in names:
+                continue
+            name = os.path.splitext(os.path.relpath(path, base))[0]
+            if name == SUMMARY_NAME:
+                raise ValueError(f"{path}: result would overwrite {SUMMARY_NAME}.json")
+            if name in owners:
+                raise ValueError(f"{owners[name]} and {path} would both write results named {name}")
+            names[path] = name
+            owners[name] = path
+    return names
+
+
+def schedule_file(path: str, config: ScheduleConfig, output_dir: str, output_format: str,
+                  name: Optional[str] = None) -> Dict:
+    """Schedule one timetable file, write its results and return its summary.
+
+    Results are written as ``<name>.json``/``<name>.csv`` under
+    ``output_dir`` (default name: the file's base name).
+    """
+    started = time.perf_counter()
+    runs = load_runs(path)
+    buses = schedule_buses(runs, config.regulation, config.min_layover_time, config.min_break_extension,
+                           config.max_continuous_time, config.prefer_alternating, config.terminal_layovers,
+                           srt=_srt, strategy=config.strategy, lookahead=config.lookahead,
+                           deadhead_percentile=config.deadhead_percentile)
+    result = {
+        'file': path,
+        'regulation': config.regulation,
+        'runs': len(runs),
+        'fleet_size': len(buses),
+        'buses': [
+            {
+                'bus_id': bus.bus_id,
+                'driving_hours': round(bus.total_driving_hours, 2),
+                'runs': [{'run_id': run.run_id, 'section': run.section, 'start': run.start.strftime('%H:%M'),
+                          'end': run.end.strftime('%H:%M'), 'stops': run.stops} for run in bus.runs],
+                'breaks': [{'start': break_time.strftime('%H:%M'), 'minutes': minutes, 'type': break_type}
+                           for break_time, minutes, break_type in get_breaks_for_bus(
+                               bus.runs, config.regulation, config.max_continuous_time, config.min_break_extension)],
+            }
+            for bus in buses
+        ],
+    }
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(os.path.dirname(os.path.join(output_dir, name)), exist_ok=True)
+    if output_format in ('json', 'both'):
+        with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if output_format in ('csv', 'both'):
+        with open(os.path.join(output_dir, f"{name}.csv"), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for bus in buses:
+                for run in bus.runs:
+                    writer.writerow((bus.bus_id, run.run_id, run.section, run.start.strftime('%H:%M'),
+                                     run.end.strftime('%H:%M'), run.stops[0] if run.stops else '',
+                                     run.stops[-1] if run.stops else '', round(run.duration_hours * 60)))
+    return {'file': path, 'runs': len(runs), 'fleet_size': len(buses),
+            'wall_seconds': round(time.perf_counter() - started, 4)}
+
+
+def _schedule_safely(path: str, config: ScheduleConfig, output_dir: str, output_format: str,
+                     name: Optional[str] = None) -> Dict:
+    try:
+        return schedule_file(path, config, output_dir, output_format, name)
+    except (OSError, ValueError, csv.Error) as e:
+        return {'file': path, 'error': str(e)}
+
+
+def run_batch(paths: List[str], config: ScheduleConfig, output_dir: str, output_format: str = 'json',
+              workers: int = 1, database_file: str = 'srt_database.json') -> List[Dict]:
+    """Schedule every timetable in ``paths``; summaries are returned in file order.
+
+    Raises ValueError if two inputs would write the same result files.
+    """
+    names = output_names(paths)
+    files = sorted(names)
+    os.makedirs(output_dir, exist_ok=True)
+    if workers <= 1 or len(files) <= 1:
+        _init_worker(database_file)
+        return [_schedule_safely(path, config, output_dir, output_format, names[path]) for path in files]
+    # multiprocessing is only imported when a pool is actually needed
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(database_file,)) as pool:
+        futures = {pool.submit(_schedule_safely, path, config, output_dir, output_format, names[path]): path
+                   for path in files}
+        for future in as_completed(futures):
+            summaries[futures[future]] = future.result()
+    return [summaries[path] for path in files]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Schedule timetable files without the web app.")
+    parser.add_argument('paths', nargs='+', help="timetable files or directories")
+    parser.add_argument('--output', '-o', required=True, help="directory for result files")
+    parser.add_argument('--format', choices=FORMATS, default='json', help="result file format")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--database', default='srt_database.json', help="SRT database JSON file")
+    parser.add_argument('--regulation', choices=('GB', 'EU'), default='GB')
+    parser.add_argument('--min-layover-time', type=int, default=15)
+    parser.add_argument('--min-break-extension', type=int, default=0)
+    parser.add_argument('--max-continuous-time', type=float, default=None)
+    parser.add_argument('--no-alternating', action='store_true', help="do not prefer alternating sections")
+    parser.add_argument('--strategy', choices=ASSIGNMENT_STRATEGIES, default=FIRST_FIT, help="bus assignment strategy")
+    parser.add_argument('--lookahead', type=int, default=SCORED_LOOKAHEAD,
+                        help=f"departures the scored strategy looks ahead (0-{MAX_LOOKAHEAD})")
+    parser.add_argument('--deadhead-percentile', type=int, default=SRT_DEADHEAD_PERCENTILE,
+                        help="percentile of observed SRT times used for deadheads (1-100)")
+    args = parser.parse_args(argv)
+
+    config = ScheduleConfig(regulation=args.regulation, min_layover_time=args.min_layover_time,
+                            min_break_extension=args.min_break_extension,
+                            max_continuous_time=args.max_continuous_time,
+                            prefer_alternating=not args.no_alternating, strategy=args.strategy,
+                            lookahead=max(0, min(args.lookahead, MAX_LOOKAHEAD)),
+                            deadhead_percentile=max(1, min(args.deadhead_percentile, 100)))
+    started = time.perf_counter()
+    try:
+        summaries = run_batch(args.paths, config, args.output, args.format, max(1, args.workers), args.database)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - started
+
+    failed = 0
+    for summary in summaries:
+        if 'error' in summary:
+            failed += 1
+            print(f"{summary['file']}: FAILED {summary['error']}", file=sys.stderr)
+        else:
+            print(f"{summary['file']}: {summary['runs']} runs, {summary['fleet_size']} buses, "
+                  f"{summary['wall_seconds']:.3f}s")
+    with open(os.path.join(args.output, f"{SUMMARY_NAME}.json"), 'w', encoding='utf-8') as f:
+        json.dump({'config': config.__dict__, 'elapsed_seconds': round(elapsed, 3), 'files': summaries}, f, indent=2)
+    print(f"Scheduled {len(summaries) - failed} of {len(summaries)} files in {elapsed:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
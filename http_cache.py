@@ -0,0 +1,143 @@
+"""HTTP response caching and compression helpers.
+
+Rendered schedules are large and identical for identical inputs, so they
+are kept, already compressed, in a size-bounded in-memory cache keyed by a
+strong ETag. Other large text responses are compressed on the way out by an
+``after_request`` hook. Brotli is used when the optional ``brotli`` package
+is installed and the client accepts it; gzip otherwise.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/csv', 'text/css', 'application/javascript'}
+
+AVAILABLE_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class CachedResponse(NamedTuple):
+    """A rendered body with its ETag and pre-compressed variants."""
+    etag: str
+    body: bytes
+    encoded: Dict[str, bytes]
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag over the JSON encoding of ``parts``."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def compress(body: bytes) -> Dict[str, bytes]:
+    """Every available encoding of ``body`` keyed by ``Content-Encoding`` value."""
+    return {encoding: encode(body, encoding) for encoding in AVAILABLE_ENCODINGS}
+
+
+def preferred_encoding(available) -> Optional[str]:
+    """The best of ``available`` encodings the current request accepts."""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return None
+
+
+class ResponseCache:
+    """Thread-safe LRU of ``CachedResponse`` objects bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(etag)
+            if cached is not None:
+                self._entries.move_to_end(etag)
+            return cached
+
+    def put(self, etag: str, body: bytes) -> CachedResponse:
+        """Compress and store ``body``; return the cached response."""
+        cached = CachedResponse(etag, body, compress(body) if len(body) >= MIN_COMPRESS_BYTES else {})
+        if cached.size > self.max_bytes:
+            return cached
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._entries[etag] = cached
+            self._size += cached.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+        return cached
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cached_response(cached: CachedResponse, mimetype: str = 'text/html') -> Response:
+    """Serve ``cached`` with its ETag, answering 304 for a matching GET or HEAD.
+
+    Other methods always get the full body: the request has already had its
+    effect, and a 304 is only defined for safe methods.
+    """
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    else:
+        encoding = preferred_encoding(cached.encoded)
+        if encoding is None:
+            response = Response(cached.body, mimetype=mimetype)
+        else:
+            response = Response(cached.encoded[encoding], mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(cached.etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_compression(app: Flask):
+    """Compress large text responses that were not already encoded."""
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_BYTES:
+            return response
+        encoding = preferred_encoding(AVAILABLE_ENCODINGS)
+        if encoding is not None:
+            response.set_data(encode(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,155 @@
+"""In-process background job queue for long scheduling requests.
+
+Large submissions are handed to a small, fixed pool of worker threads so
+request workers return immediately with a job ID. Jobs report progress as
+they go; clients poll the job or wait on ``wait_for_update`` (used by the
+server-sent events stream). Finished jobs are kept for retrieval until the
+oldest are evicted.
+
+No external broker is needed: the queue lives in the web process, so jobs
+do not survive a restart.
+"""
+
+import itertools
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the pending queue is full."""
+
+
+@dataclass
+class Job:
+    """A unit of background work and its observable state."""
+
+    job_id: str
+    status: str = QUEUED
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    version: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly view of the job, without its result."""
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded pool of worker threads fed from a bounded FIFO queue.
+
+    Workers are started on the first submission. At most ``max_pending``
+    jobs may wait at once, and only the newest ``max_finished`` finished
+    jobs are retained.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 32, max_finished: int = 64):
+        self.workers = workers
+        self.max_finished = max_finished
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        self._sequence = itertools.count(1)
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Job:
+        """Queue ``func(report, *args, **kwargs)`` and return its job.
+
+        ``report`` is a callable taking keyword arguments that are merged
+        into the job's progress. The return value of ``func`` becomes the
+        job's result.
+        """
+        self._start_workers()
+        job = Job(job_id=uuid.uuid4().hex)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        try:
+            self._pending.put_nowait((job, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.job_id]
+            raise JobQueueFull(f"{self._pending.maxsize} jobs are already waiting")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for_update(self, job: Job, seen_version: int, timeout: float) -> int:
+        """Block until ``job`` changes past ``seen_version`` or ``timeout`` passes."""
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != seen_version, timeout)
+            return job.version
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{next(self._sequence)}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _update(self, job: Job, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _report(self, job: Job, **progress):
+        with self._changed:
+            job.progress.update(progress)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _work(self):
+        while True:
+            job, func, args, kwargs = self._pending.get()
+            self._update(job, status=RUNNING, started_at=time.time())
+            try:
+                result = func(lambda **progress: self._report(job, **progress), *args, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job, status=FAILED, error=str(e) or e.__class__.__name__, finished_at=time.time())
+            else:
+                self._update(job, status=DONE, result=result, finished_at=time.time())
+            finally:
+                self._pending.task_done()
+            self._evict_finished()
+
+    def _evict_finished(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
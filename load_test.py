@@ -0,0 +1,300 @@
+"""Concurrent load test of the scheduling routes.
+
+Usage::
+
+    python load_test.py [--requests 200] [--clients 8] [--runs 40] [--stops 8]
+                        [--generate-ratio 0.5] [--server] [--seed 1]
+
+Realistic form submissions are generated for ``/schedule`` (the
+``inbound_run_{i}_*`` / ``outbound_run_{i}_*`` layout of the entry form,
+half of them with ``skip_configuration``) and ``/generate`` (the
+``run_{i}_*`` layout of the configuration page). Every payload has its own
+run times over a shared pool of stop names, so concurrent requests update
+the same SRT entries. They are replayed from ``--clients`` threads either
+through Flask's test client or, with ``--server``, over HTTP against a
+local threaded WSGI server.
+
+The app runs against a scratch SRT database and schedule store in a
+temporary directory. Afterwards latency percentiles and error rates are
+reported per route, and the SRT database (in memory and as saved on disk)
+is checked for lost updates: every entry's sample count must have grown by
+exactly the observations of the distinct run sets of successful requests.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import app as web
+from scheduler import RunRow, build_runs
+from schedule_store import ScheduleStore
+from srt_database import SRTDatabase, srt_db
+
+PERCENTILES = (50, 90, 99)
+
+SECTIONS = ('inbound', 'outbound')
+
+
+class Payload(NamedTuple):
+    route: str
+    form: Dict[str, str]
+    rows: List[RunRow]
+
+
+class Result(NamedTuple):
+    route: str
+    status: int
+    seconds: float
+    rows: List[RunRow]
+
+
+def _clock(minutes: int) -> str:
+    return f"{(minutes // 60) % 24:02d}:{minutes % 60:02d}"
+
+
+def make_rows(rng: random.Random, stations: List[str], runs: int, stops: int) -> List[RunRow]:
+    """``runs`` timetabled runs along a line of ``stops`` stations, both ways."""
+    rows: List[RunRow] = []
+    for i in range(runs):
+        section = SECTIONS[i % 2]
+        first = rng.randrange(0, len(stations) - stops + 1)
+        line = stations[first:first + stops]
+        if section == 'outbound':
+            line = line[::-1]
+        minutes = [rng.randrange(5 * 60, 22 * 60)]
+        for _ in range(stops - 1):
+            minutes.append(minutes[-1] + rng.randint(2, 15))
+        times = [_clock(m) for m in minutes]
+        rows.append((f"{section[0].upper()}{i + 1}", times[0], times[-1], line, section, times))
+    return rows
+
+
+def schedule_form(rows: List[RunRow], regulation: str = 'GB', skip_configuration: bool = False) -> Dict[str, str]:
+    """Entry form fields (``index.html``) posted to ``/schedule``."""
+    form = {'regulation': regulation, 'skip_configuration': 'true' if skip_configuration else 'false'}
+    counts = dict.fromkeys(SECTIONS, 0)
+    for run_id, start, end, stops, section, stop_times in rows:
+        prefix = f"{section}_run_{counts[section]}"
+        counts[section] += 1
+        form.update({
+            f'{prefix}_name': run_id,
+            f'{prefix}_start': start,
+            f'{prefix}_end': end,
+            f'{prefix}_stops': '\n'.join(stops),
+            f'{prefix}_stop_times': ','.join(stop_times or []),
+        })
+    form.update({f'{section}_count': str(count) for section, count in counts.items()})
+    return form
+
+
+def generate_form(rows: List[RunRow], regulation: str = 'GB', min_layover_time: int = 15) -> Dict[str, str]:
+    """Configuration page fields (``configure.html``) posted to ``/generate``."""
+    form = {'regulation': regulation, 'run_count': str(len(rows)), 'min_layover_time': str(min_layover_time),
+            'min_break_extension': '5', 'max_continuous_time': 'default', 'prefer_alternating': 'true'}
+    for i, (run_id, start, end, stops, section, stop_times) in enumerate(rows):
+        form.update({
+            f'run_{i}_id': run_id,
+            f'run_{i}_start': start,
+            f'run_{i}_end': end,
+            f'run_{i}_section': section,
+            f'run_{i}_stops': '|'.join(stops),
+            f'run_{i}_stop_times': ','.join(stop_times or []),
+        })
+    return form
+
+
+def make_payloads(count: int, runs: int, stops: int, generate_ratio: float, seed: int) -> List[Payload]:
+    rng = random.Random(seed)
+    stations = [f"Stop {i:02d}" for i in range(max(stops * 3, 12))]
+    payloads = []
+    for i in range(count):
+        rows = make_rows(rng, stations, runs, stops)
+        if rng.random() < generate_ratio:
+            payloads.append(Payload('/generate', generate_form(rows, min_layover_time=rng.choice((10, 15, 20))), rows))
+        else:
+            payloads.append(Payload('/schedule', schedule_form(rows, skip_configuration=i % 2 == 0), rows))
+    return payloads
+
+
+def test_client_sender() -> Callable[[Payload], int]:
+    local = threading.local()
+
+    def send(payload: Payload) -> int:
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = web.app.test_client()
+        return client.post(payload.route, data=payload.form).status_code
+
+    return send
+
+
+def http_sender(base_url: str) -> Callable[[Payload], int]:
+    def send(payload: Payload) -> int:
+        data = urllib.parse.urlencode(payload.form).encode('ascii')
+        try:
+            with urllib.request.urlopen(base_url + payload.route, data=data, timeout=300) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return send
+
+
+def replay(payloads: List[Payload], send: Callable[[Payload], int], clients: int) -> Tuple[List[Result], float]:
+    """Send every payload from ``clients`` threads; return results and wall time."""
+
+    def timed(payload: Payload) -> Result:
+        started = time.perf_counter()
+        try:
+            status = send(payload)
+        except Exception:
+            status = 0
+        return Result(payload.route, status, time.perf_counter() - started, payload.rows)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(timed, payloads))
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, -(-len(sorted_values) * p // 100) - 1)]
+
+
+def summarize(results: List[Result]) -> Dict[str, Dict]:
+    summary = {}
+    for route in sorted({result.route for result in results}):
+        route_results = [result for result in results if result.route == route]
+        latencies = sorted(result.seconds for result in route_results)
+        errors = sum(1 for result in route_results if result.status != 200)
+        summary[route] = {
+            'requests': len(route_results),
+            'errors': errors,
+            'error_rate': errors / len(route_results),
+            'mean_ms': 1000 * sum(latencies) / len(latencies),
+            'max_ms': 1000 * latencies[-1],
+            **{f'p{p}_ms': 1000 * percentile(latencies, p) for p in PERCENTILES},
+        }
+    return summary
+
+
+def expected_samples(before: Dict[str, int], results: List[Result]) -> Dict[str, int]:
+    """SRT sample counts after applying every successful request to ``before``.
+
+    Like the database, each distinct set of runs is counted once.
+    """
+    expected = dict(before)
+    aggregator = SRTDatabase()
+    recorded = set()
+    for result in results:
+        if result.status == 200:
+            runs = build_runs(result.rows)
+            runs_key = SRTDatabase.runs_key(runs)
+            if runs_key in recorded:
+                continue
+            recorded.add(runs_key)
+            for key, entry in aggregator.aggregate_runs(runs).items():
+                expected[key] = expected.get(key, 0) + entry.samples
+    return expected
+
+
+def lost_updates(expected: Dict[str, int], data) -> List[Tuple[str, int, int]]:
+    """``(key, expected, actual)`` for every entry whose sample count is wrong."""
+    actual = {key: entry.samples for key, entry in data.items()}
+    return [(key, count, actual.get(key, 0)) for key, count in sorted(expected.items())
+            if actual.get(key, 0) != count]
+
+
+def _isolate(directory: str):
+    """Point the app's SRT database and schedule store at ``directory``."""
+    srt_db.database_file = f"{directory}/srt_database.json"
+    srt_db.snapshot_file = f"{directory}/srt_database.srtb"
+    srt_db.load_database()
+    web.schedule_store = ScheduleStore(f"{directory}/schedules.db")
+
+
+def run_load_test(requests: int = 200, clients: int = 8, runs: int = 40, stops: int = 8,
+                  generate_ratio: float = 0.5, server: bool = False, seed: int = 1,
+                  directory: Optional[str] = None) -> Dict:
+    """Run the load test against a scratch database in ``directory`` and return the report."""
+    with tempfile.TemporaryDirectory(prefix='bus-load-') as scratch:
+        _isolate(directory or scratch)
+        payloads = make_payloads(requests, runs, stops, generate_ratio, seed)
+        before = {key: entry.samples for key, entry in srt_db.data.items()}
+
+        httpd = None
+        if server:
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            httpd = make_server('127.0.0.1', 0, web.app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            send = http_sender(f"http://127.0.0.1:{httpd.server_port}")
+        else:
+            send = test_client_sender()
+        try:
+            results, elapsed = replay(payloads, send, clients)
+        finally:
+            if httpd is not None:
+                httpd.shutdown()
+
+        expected = expected_samples(before, results)
+        return {
+            'requests': len(results),
+            'clients': clients,
+            'elapsed_seconds': elapsed,
+            'throughput_rps': len(results) / elapsed if elapsed > 0 else 0.0,
+            'routes': summarize(results),
+            'srt_entries': len(srt_db.data),
+            'lost_in_memory': lost_updates(expected, srt_db.data),
+            'lost_on_disk': lost_updates(expected, SRTDatabase(srt_db.database_file).data),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent load test of /schedule and /generate.")
+    parser.add_argument('--requests', type=int, default=200, help="total form submissions")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent client threads")
+    parser.add_argument('--runs', type=int, default=40, help="runs per submission")
+    parser.add_argument('--stops', type=int, default=8, help="stops per run")
+    parser.add_argument('--generate-ratio', type=float, default=0.5, help="share of /generate submissions")
+    parser.add_argument('--server', action='store_true', help="go through a local WSGI server over HTTP")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--directory', help="keep the scratch database here instead of a temp directory")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.requests, args.clients, args.runs, max(2, args.stops), args.generate_ratio,
+                           args.server, args.seed, args.directory)
+    print(f"{report['requests']} requests from {report['clients']} clients in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_rps']:.1f} req/s)")
+    print(f"{'route':<12}{'requests':>9}{'errors':>8}{'error %':>9}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+          + f"{'max ms':>10}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<12}{stats['requests']:>9}{stats['errors']:>8}{stats['error_rate']:>9.1%}"
+              + ''.join(f"{stats[f'p{p}_ms']:>10.1f}" for p in PERCENTILES) + f"{stats['max_ms']:>10.1f}")
+    lost = report['lost_in_memory'] or report['lost_on_disk']
+    print(f"SRT: {report['srt_entries']} entries, {len(report['lost_in_memory'])} lost in memory, "
+          f"{len(report['lost_on_disk'])} lost on disk")
+    for key, expected, actual in lost[:10]:
+        print(f"  {key}: expected {expected} samples, found {actual}")
+    errors = sum(stats['errors'] for stats in report['routes'].values())
+    return 1 if lost or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
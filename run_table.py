@@ -0,0 +1,286 @@
+"""Columnar storage for large run sets.
+
+A ``Run`` object costs two ``datetime`` objects and two Python lists of
+strings; at network scale (100k+ trips) that dominates memory. A
+``RunTable`` instead keeps each field in a flat typed array:
+
+* start/end times as integer minutes after midnight of the service day
+  (an end past midnight is ``>= 1440``),
+* stops as IDs into an interned stop-name table, with per-run offsets into
+  one flat stop array and parallel arrays of stop times in minutes and
+  their seconds (``-1`` where the source time had no seconds field),
+* the section, as an ID into an interned section-name table that starts
+  with ``inbound`` and ``outbound``, and the assigned bus ID of every run.
+
+Tables save to a single file whose columns are memory-mapped on load, so a
+saved table opens without deserializing anything. ``RunTable.views()``
+yields ``RunView`` objects that behave like ``Run`` for ``schedule_buses``
+and the templates, building values from the columns only when accessed.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from time_parsing import INVALID, MINUTES_PER_DAY, clock_datetime, parse_times
+
+SECTIONS = ('inbound', 'outbound')
+
+# Bus ID of runs that have not been scheduled yet
+UNASSIGNED = 0
+
+_MAGIC = b'RUNT'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHHII')
+_COLUMN = struct.Struct('<QQ')
+
+# (name, array typecode) in file order
+_COLUMNS = (
+    ('start', 'i'),
+    ('end', 'i'),
+    ('section', 'H'),
+    ('bus', 'i'),
+    ('stop_offsets', 'I'),
+    ('stop_ids', 'I'),
+    ('stop_minutes', 'i'),
+    ('stop_seconds', 'b'),
+    ('run_id_offsets', 'I'),
+    ('run_id_data', 'B'),
+    ('stop_name_offsets', 'I'),
+    ('stop_name_data', 'B'),
+    ('section_name_offsets', 'I'),
+    ('section_name_data', 'B'),
+)
+
+# Marks stop times that were given without seconds
+NO_SECONDS = -1
+
+# Runs can end up to a day after the service day starts
+_DAY_AFTER = [clock_datetime(minute) + timedelta(days=1) for minute in range(MINUTES_PER_DAY)]
+
+
+def _clock(minutes: int):
+    if minutes < MINUTES_PER_DAY:
+        return clock_datetime(minutes)
+    return _DAY_AFTER[minutes - MINUTES_PER_DAY]
+
+
+def _format_minutes(minutes: int) -> str:
+    return f"{(minutes // 60) % 24:02d}:{minutes % 60:02d}"
+
+
+def _format_stop_time(minutes: int, seconds: int) -> str:
+    if seconds == NO_SECONDS:
+        return _format_minutes(minutes)
+    return f"{_format_minutes(minutes)}:{seconds:02d}"
+
+
+def _seconds_field(value: str) -> int:
+    """Seconds of an already validated ``HH:MM[:SS]`` string."""
+    parts = value.split(':')
+    return int(parts[2]) if len(parts) == 3 else NO_SECONDS
+
+
+def _unpack_strings(offsets, data) -> List[str]:
+    return [bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def _pack_strings(values: Iterable[str]):
+    offsets = array('I', [0])
+    data = bytearray()
+    for value in values:
+        data += value.encode('utf-8')
+        offsets.append(len(data))
+    return offsets, array('B', data)
+
+
+class RunView:
+    """Read-only, ``Run``-compatible view of one row of a ``RunTable``."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: 'RunTable', index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def run_id(self) -> str:
+        return self.table.run_id(self.index)
+
+    @property
+    def start(self):
+        return _clock(self.table.start[self.index])
+
+    @property
+    def end(self):
+        return _clock(self.table.end[self.index])
+
+    @property
+    def section(self) -> str:
+        return self.table.section_names[self.table.section[self.index]]
+
+    @property
+    def bus_id(self) -> int:
+        return self.table.bus[self.index]
+
+    @property
+    def stops(self) -> List[str]:
+        table = self.table
+        names = table.stop_names
+        first, last = table.stop_offsets[self.index], table.stop_offsets[self.index + 1]
+        return [names[stop_id] for stop_id in table.stop_ids[first:last]]
+
+    @property
+    def stop_times(self) -> Optional[List[str]]:
+        table = self.table
+        first, last = table.stop_offsets[self.index], table.stop_offsets[self.index + 1]
+        if first == last or table.stop_minutes[first] == INVALID:
+            return None
+        return [_format_stop_time(minutes, seconds)
+                for minutes, seconds in zip(table.stop_minutes[first:last], table.stop_seconds[first:last])]
+
+    @property
+    def duration_hours(self) -> float:
+        return (self.table.end[self.index] - self.table.start[self.index]) / 60.0
+
+    def get_stop_time(self, stop_index: int) -> str:
+        """Get the time for a specific stop, either from stop_times or calculated."""
+        table = self.table
+        first, last = table.stop_offsets[self.index], table.stop_offsets[self.index + 1]
+        if first + stop_index < last and table.stop_minutes[first] != INVALID:
+            return _format_stop_time(table.stop_minutes[first + stop_index], table.stop_seconds[first + stop_index])
+        start, end = table.start[self.index], table.end[self.index]
+        if last - first <= 1:
+            return _format_minutes(start)
+        estimated = start + stop_index * (end - start) / (last - first - 1)
+        return _format_minutes(int(estimated))
+
+    def __repr__(self) -> str:
+        return f"RunView({self.run_id!r}, {self.section}, {_format_minutes(self.table.start[self.index])})"
+
+
+class RunTable:
+    """Columnar table of runs, optionally backed by a memory-mapped file."""
+
+    def __init__(self, columns: Dict[str, Sequence], stop_names: List[str], section_names: List[str],
+                 buffer=None):
+        for name, _ in _COLUMNS:
+            setattr(self, name, columns[name])
+        self.stop_names = stop_names
+        self.section_names = section_names
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def from_runs(cls, runs: Sequence, buses: Optional[Sequence] = None) -> 'RunTable':
+        """Build a table from ``Run``-like objects, recording bus IDs if given.
+
+        Sections other than ``inbound``/``outbound`` are interned like stop
+        names.
+        """
+        stop_index: Dict[str, int] = {}
+        stop_names: List[str] = []
+        section_names = list(SECTIONS)
+        section_index = {name: index for index, name in enumerate(section_names)}
+        start, end, section = array('i'), array('i'), array('H')
+        stop_offsets, stop_ids = array('I', [0]), array('I')
+        stop_minutes, stop_seconds = array('i'), array('b')
+        for run in runs:
+            start_minutes = run.start.hour * 60 + run.start.minute
+            end_minutes = start_minutes + int((run.end - run.start).total_seconds() // 60)
+            start.append(start_minutes)
+            end.append(end_minutes)
+            section_id = section_index.get(run.section)
+            if section_id is None:
+                section_id = section_index[run.section] = len(section_names)
+                section_names.append(run.section)
+            section.append(section_id)
+            for stop in run.stops:
+                stop_id = stop_index.get(stop)
+                if stop_id is None:
+                    stop_id = stop_index[stop] = len(stop_names)
+                    stop_names.append(stop)
+                stop_ids.append(stop_id)
+            parsed = parse_times(run.stop_times) if run.stop_times else None
+            if parsed is not None and parsed.ok and len(parsed.minutes) == len(run.stops):
+                stop_minutes.extend(parsed.minutes)
+                stop_seconds.extend(_seconds_field(value) for value in run.stop_times)
+            else:
+                stop_minutes.extend([INVALID] * len(run.stops))
+                stop_seconds.extend([NO_SECONDS] * len(run.stops))
+            stop_offsets.append(len(stop_ids))
+        run_id_offsets, run_id_data = _pack_strings(run.run_id for run in runs)
+        stop_name_offsets, stop_name_data = _pack_strings(stop_names)
+        section_name_offsets, section_name_data = _pack_strings(section_names)
+        columns = {
+            'start': start, 'end': end, 'section': section, 'bus': array('i', [UNASSIGNED] * len(start)),
+            'stop_offsets': stop_offsets, 'stop_ids': stop_ids, 'stop_minutes': stop_minutes,
+            'stop_seconds': stop_seconds, 'run_id_offsets': run_id_offsets, 'run_id_data': run_id_data,
+            'stop_name_offsets': stop_name_offsets, 'stop_name_data': stop_name_data,
+            'section_name_offsets': section_name_offsets, 'section_name_data': section_name_data,
+        }
+        table = cls(columns, stop_names, section_names)
+        if buses is not None:
+            table.assign(buses)
+        return table
+
+    def assign(self, buses: Sequence):
+        """Record bus IDs from ``schedule_buses`` output built from this table's views."""
+        if isinstance(self.bus, memoryview):
+            self.bus = array('i', self.bus)
+        for bus in buses:
+            for run in bus.runs:
+                self.bus[run.index] = bus.bus_id
+
+    def run_id(self, index: int) -> str:
+        first, last = self.run_id_offsets[index], self.run_id_offsets[index + 1]
+        return bytes(self.run_id_data[first:last]).decode('utf-8')
+
+    def view(self, index: int) -> RunView:
+        return RunView(self, index)
+
+    def views(self) -> List[RunView]:
+        """``Run``-compatible views of every row, in table order."""
+        return [RunView(self, index) for index in range(len(self))]
+
+    def save(self, path: str):
+        """Write the table to ``path`` in the memory-mappable format."""
+        data = [array(typecode, getattr(self, name)).tobytes() for name, typecode in _COLUMNS]
+        offset = _HEADER.size + _COLUMN.size * len(_COLUMNS)
+        directory = []
+        for chunk in data:
+            offset = (offset + 7) & ~7  # keep every column 8-byte aligned
+            directory.append((offset, len(chunk)))
+            offset += len(chunk)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(_COLUMNS), len(self), len(self.stop_ids)))
+            for column_offset, size in directory:
+                f.write(_COLUMN.pack(column_offset, size))
+            for (column_offset, _), chunk in zip(directory, data):
+                f.write(b'\0' * (column_offset - f.tell()))
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RunTable':
+        """Memory-map a table saved with ``save``; columns are not copied."""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, column_count, _, _ = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != _VERSION or column_count != len(_COLUMNS):
+            buffer.close()
+            raise ValueError(f"{path} is not a version {_VERSION} run table")
+        view = memoryview(buffer)
+        columns = {}
+        for position, (name, typecode) in enumerate(_COLUMNS):
+            offset, size = _COLUMN.unpack_from(buffer, _HEADER.size + position * _COLUMN.size)
+            columns[name] = view[offset:offset + size].cast(typecode)
+        stop_names = _unpack_strings(columns['stop_name_offsets'], columns['stop_name_data'])
+        section_names = _unpack_strings(columns['section_name_offsets'], columns['section_name_data'])
+        return cls(columns, stop_names, section_names, buffer)
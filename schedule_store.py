@@ -0,0 +1,199 @@
+"""Persistent, versioned store of generated schedules.
+
+Every generated schedule is saved to a local SQLite database together with
+its runs, bus assignments, configuration and the version of the SRT data it
+was solved with. Schedules are grouped into named series with increasing
+version numbers. A stored schedule can be served again byte-for-byte
+without re-solving, and two versions can be diffed with indexed joins.
+"""
+
+import gzip
+import json
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+DEFAULT_SCHEDULE_NAME = 'default'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    inputs_key TEXT NOT NULL,
+    regulation TEXT NOT NULL,
+    config TEXT NOT NULL,
+    srt_version TEXT NOT NULL,
+    fleet_size INTEGER NOT NULL,
+    run_count INTEGER NOT NULL,
+    page BLOB NOT NULL,
+    UNIQUE (name, version)
+);
+CREATE INDEX IF NOT EXISTS schedules_by_inputs ON schedules (name, inputs_key);
+CREATE TABLE IF NOT EXISTS schedule_runs (
+    schedule_id INTEGER NOT NULL REFERENCES schedules (id) ON DELETE CASCADE,
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    bus_id INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    stops TEXT NOT NULL,
+    stop_times TEXT,
+    PRIMARY KEY (schedule_id, run_id)
+) WITHOUT ROWID;
+"""
+
+
+class StoredSchedule(NamedTuple):
+    """Metadata of one saved schedule version."""
+    id: int
+    name: str
+    version: int
+    created_at: str
+    regulation: str
+    config: Dict
+    srt_version: str
+    fleet_size: int
+    run_count: int
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+class ScheduleStore:
+    """SQLite-backed schedule repository; safe to share between threads."""
+
+    def __init__(self, database_file: str = "schedules.db"):
+        self.database_file = database_file
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_file, timeout=30)
+            connection.execute('PRAGMA foreign_keys = ON')
+            connection.execute('PRAGMA journal_mode = WAL')
+            if not self._initialized:
+                connection.executescript(_SCHEMA)
+                self._initialized = True
+            self._local.connection = connection
+        return connection
+
+    def find(self, name: str, inputs_key: str) -> Optional[int]:
+        """ID of the latest version of ``name`` saved with ``inputs_key``."""
+        row = self._connection().execute(
+            'SELECT id FROM schedules WHERE name = ? AND inputs_key = ? ORDER BY version DESC LIMIT 1',
+            (name, inputs_key)).fetchone()
+        return row[0] if row else None
+
+    def save(self, name: str, runs: Sequence, buses: Sequence, config: Dict, inputs_key: str,
+             srt_version: str, page: bytes) -> int:
+        """Save a schedule as the next version of ``name`` and return its ID."""
+        run_to_bus = {run.run_id: bus.bus_id for bus in buses for run in bus.runs}
+        rows = [(run.run_id, position, run_to_bus.get(run.run_id, 0), run.section,
+                 run.start.strftime('%H:%M'), run.end.strftime('%H:%M'), '|'.join(run.stops),
+                 ','.join(run.stop_times) if run.stop_times else None)
+                for position, run in enumerate(runs)]
+        connection = self._connection()
+        with self._write_lock, connection:
+            version = connection.execute(
+                'SELECT COALESCE(MAX(version), 0) + 1 FROM schedules WHERE name = ?', (name,)).fetchone()[0]
+            cursor = connection.execute(
+                'INSERT INTO schedules (name, version, created_at, inputs_key, regulation, config, srt_version,'
+                ' fleet_size, run_count, page) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (name, version, datetime.now().isoformat(), inputs_key, config.get('regulation', ''),
+                 json.dumps(config), srt_version, len(buses), len(runs), gzip.compress(page, mtime=0)))
+            schedule_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT OR REPLACE INTO schedule_runs (schedule_id, run_id, position, bus_id, section,'
+                ' start_time, end_time, stops, stop_times) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(schedule_id,) + row for row in rows])
+        return schedule_id
+
+    def _metadata(self, row) -> StoredSchedule:
+        return StoredSchedule(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), row[6], row[7], row[8])
+
+    _METADATA_COLUMNS = 'id, name, version, created_at, regulation, config, srt_version, fleet_size, run_count'
+
+    def get(self, schedule_id: int) -> Optional[StoredSchedule]:
+        row = self._connection().execute(
+            f'SELECT {self._METADATA_COLUMNS} FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return self._metadata(row) if row else None
+
+    def get_page(self, schedule_id: int) -> Optional[bytes]:
+        """The gzip-compressed rendered page of a stored schedule."""
+        row = self._connection().execute('SELECT page FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_runs(self, schedule_id: int) -> List[Dict]:
+        """Stored runs with their bus assignments, in input order."""
+        rows = self._connection().execute(
+            'SELECT run_id, bus_id, section, start_time, end_time, stops, stop_times FROM schedule_runs'
+            ' WHERE schedule_id = ? ORDER BY position', (schedule_id,)).fetchall()
+        return [{'run_id': run_id, 'bus_id': bus_id, 'section': section, 'start': start, 'end': end,
+                 'stops': stops.split('|') if stops else [], 'stop_times': stop_times.split(',') if stop_times else None}
+                for run_id, bus_id, section, start, end, stops, stop_times in rows]
+
+    def list_versions(self, name: Optional[str] = None, limit: int = 50) -> List[StoredSchedule]:
+        """Newest schedules first, optionally only those in series ``name``."""
+        if name is None:
+            rows = self._connection().execute(
+                f'SELECT {self._METADATA_COLUMNS} FROM schedules ORDER BY id DESC LIMIT ?', (limit,))
+        else:
+            rows = self._connection().execute(
+                f'SELECT {self._METADATA_COLUMNS} FROM schedules WHERE name = ? ORDER BY version DESC LIMIT ?',
+                (name, limit))
+        return [self._metadata(row) for row in rows]
+
+    def diff(self, from_id: int, to_id: int) -> Optional[Dict]:
+        """Runs moved between buses, added or removed, and the fleet change.
+
+        Bus IDs are only creation-order numbers, so buses of the two
+        versions are first matched by the runs they share (largest overlap
+        first); a run has moved when its two buses are not a matched pair.
+        """
+        before, after = self.get(from_id), self.get(to_id)
+        if before is None or after is None:
+            return None
+        connection = self._connection()
+        common = connection.execute(
+            'SELECT a.run_id, a.bus_id, b.bus_id FROM schedule_runs a'
+            ' JOIN schedule_runs b ON b.schedule_id = ? AND b.run_id = a.run_id'
+            ' WHERE a.schedule_id = ? ORDER BY a.position',
+            (to_id, from_id)).fetchall()
+        removed = connection.execute(
+            'SELECT a.run_id FROM schedule_runs a WHERE a.schedule_id = ? AND NOT EXISTS'
+            ' (SELECT 1 FROM schedule_runs b WHERE b.schedule_id = ? AND b.run_id = a.run_id)'
+            ' ORDER BY a.position', (from_id, to_id)).fetchall()
+        added = connection.execute(
+            'SELECT b.run_id FROM schedule_runs b WHERE b.schedule_id = ? AND NOT EXISTS'
+            ' (SELECT 1 FROM schedule_runs a WHERE a.schedule_id = ? AND a.run_id = b.run_id)'
+            ' ORDER BY b.position', (to_id, from_id)).fetchall()
+        matched = _match_buses(Counter((from_bus, to_bus) for _, from_bus, to_bus in common))
+        return {
+            'from': before.to_dict(),
+            'to': after.to_dict(),
+            'fleet_change': after.fleet_size - before.fleet_size,
+            'srt_changed': before.srt_version != after.srt_version,
+            'moved': [{'run_id': run_id, 'from_bus': from_bus, 'to_bus': to_bus}
+                      for run_id, from_bus, to_bus in common if matched.get(from_bus) != to_bus],
+            'added': [row[0] for row in added],
+            'removed': [row[0] for row in removed],
+        }
+
+
+def _match_buses(shared: Counter) -> Dict[int, int]:
+    """Pair old and new bus IDs greedily by the number of runs they share."""
+    matched: Dict[int, int] = {}
+    taken = set()
+    for (from_bus, to_bus), _ in sorted(shared.items(), key=lambda item: (-item[1], item[0])):
+        if from_bus not in matched and to_bus not in taken:
+            matched[from_bus] = to_bus
+            taken.add(to_bus)
+    return matched
@@ -0,0 +1,449 @@
+"""Scheduling core shared by the web app and offline tools.
+
+Runs, bus assignment and break calculation live here rather than in
+``app.py``. Nothing here imports Flask, so command-line tools and worker
+processes can schedule without loading the web application.
+"""
+
+import bisect
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from srt_database import TIME_BANDS, SRTDatabase, srt_db, time_band
+from time_parsing import INVALID, clock_datetime, parse_times
+
+# Default percentile of observed SRT durations used for deadhead times
+SRT_DEADHEAD_PERCENTILE = 85
+
+# How often (in runs assigned) schedule_buses reports progress
+PROGRESS_INTERVAL = 50
+
+# Assignment strategies of schedule_buses
+FIRST_FIT = 'first_fit'
+SCORED = 'scored'
+ASSIGNMENT_STRATEGIES = (FIRST_FIT, SCORED)
+
+# Scored assignment: feasible buses weighed per run, availability index
+# entries inspected per scan, departures looked ahead by default and at
+# most, and score weights in minutes
+SCORED_CANDIDATES = 4
+SCORED_SCAN_LIMIT = 32
+SCORED_LOOKAHEAD = 3
+MAX_LOOKAHEAD = 10
+DEADHEAD_WEIGHT = 2.0
+HEADROOM_WEIGHT = 30.0
+ALTERNATING_BONUS = 10.0
+LOOKAHEAD_PENALTY = 60.0
+
+
+@dataclass
+class Run:
+    """Represents a single bus run.
+
+    Attributes
+    ----------
+    run_id:
+        A unique identifier for the run (typically the name provided by
+        the user).
+    start:
+        A ``datetime`` representing the start time of the run. The date
+        component is arbitrary (today) but required for time
+        arithmetic.
+    end:
+        A ``datetime`` representing the end time of the run. If the run
+        crosses midnight it will be one day after the start.
+    stops:
+        A list of stops for the run, used only for display purposes.
+    section:
+        Either ``inbound`` or ``outbound`` to denote which section the
+        run came from.
+    stop_times:
+        Optional list of time strings for each stop (e.g., ['08:00', '08:15', '08:30']).
+        Used for accurate SRT calculation when available.
+    """
+
+    run_id: str
+    start: datetime
+    end: datetime
+    stops: List[str]
+    section: str
+    stop_times: Optional[List[str]] = None
+
+    @property
+    def duration_hours(self) -> float:
+        """Return the duration of the run in hours."""
+        return (self.end - self.start).total_seconds() / 3600.0
+    
+    def get_stop_time(self, stop_index: int) -> str:
+        """Get the time for a specific stop, either from stop_times or calculated."""
+        if self.stop_times and stop_index < len(self.stop_times):
+            return self.stop_times[stop_index]
+        
+        # Calculate estimated time based on position in route
+        if len(self.stops) <= 1:
+            return self.start.strftime('%H:%M')
+            
+        total_duration_minutes = (self.end - self.start).total_seconds() / 60
+        segments = len(self.stops) - 1
+        time_per_segment = total_duration_minutes / segments
+        estimated_minutes = stop_index * time_per_segment
+        
+        estimated_time = self.start + timedelta(minutes=estimated_minutes)
+        return estimated_time.strftime('%H:%M')
+
+
+@dataclass
+class BusAssignment:
+    """Represents a bus and the runs assigned to it."""
+
+    bus_id: int
+    runs: List[Run] = field(default_factory=list)
+
+    @property
+    def total_driving_hours(self) -> float:
+        return sum(r.duration_hours for r in self.runs)
+
+    @property
+    def last_end_time(self) -> datetime:
+        return self.runs[-1].end if self.runs else datetime.min
+
+
+@dataclass
+class ScheduleConfig:
+    """Scheduling options chosen on the configuration page."""
+
+    regulation: str = 'GB'
+    min_layover_time: int = 15
+    min_break_extension: int = 0
+    max_continuous_time: Optional[float] = None
+    prefer_alternating: bool = True
+    terminal_layovers: Dict[str, int] = field(default_factory=dict)
+    strategy: str = FIRST_FIT
+    lookahead: int = SCORED_LOOKAHEAD
+    deadhead_percentile: int = SRT_DEADHEAD_PERCENTILE
+
+
+# Raw run fields as submitted: (run_id, start, end, stops, section, stop_times)
+RunRow = Tuple[str, str, str, List[str], str, Optional[List[str]]]
+
+
+def build_runs(rows: List[RunRow]) -> List[Run]:
+    """Build runs from submitted rows, parsing all start/end times in one batch.
+
+    Rows whose start or end is not a valid ``HH:MM`` time are skipped. A run
+    ending at or before its start is assumed to finish the following day.
+    """
+    starts = parse_times([row[1] for row in rows], allow_seconds=False).minutes
+    ends = parse_times([row[2] for row in rows], allow_seconds=False).minutes
+    runs: List[Run] = []
+    for i, (run_id, _, _, stops, section, stop_times) in enumerate(rows):
+        if starts[i] == INVALID or ends[i] == INVALID:
+            continue
+        start_dt = clock_datetime(starts[i])
+        end_dt = clock_datetime(ends[i])
+        if end_dt <= start_dt:
+            end_dt = end_dt + timedelta(days=1)
+        runs.append(Run(run_id=run_id, start=start_dt, end=end_dt, stops=stops, section=section, stop_times=stop_times))
+    return runs
+
+
+def get_breaks_for_bus(bus_runs, regime, max_continuous_time: Optional[float] = None, min_break_extension: int = 0):
+    """Return a list of (break_time, break_length_minutes, break_type) for a bus's runs based on regime."""
+    breaks = []
+    
+    # Use custom continuous limit if provided, otherwise use regulation default
+    if max_continuous_time is not None:
+        continuous_limit = max_continuous_time
+    else:
+        continuous_limit = 4.5 if regime == 'EU' else 5.5  # hours
+    
+    driving_since_last_break = 0.0
+    
+    for i, run in enumerate(bus_runs):
+        # Check if we need a break before this run
+        if driving_since_last_break > 0 and driving_since_last_break + run.duration_hours > continuous_limit:
+            # Need a break before this run
+            if regime == 'EU':
+                # EU rules: 45 minutes total (can be split but use single break for simplicity)
+                base_break_duration = 45
+                break_type = "EU Break"
+            else:
+                # GB domestic: 30 minutes minimum, cannot be split
+                base_break_duration = 30
+                break_type = "GB Break"
+            
+            total_break_duration = base_break_duration + min_break_extension
+            breaks.append((run.start - timedelta(minutes=total_break_duration), total_break_duration, break_type))
+            driving_since_last_break = 0.0
+        
+        driving_since_last_break += run.duration_hours
+    
+    return breaks
+
+
+class _AssignmentRules:
+    """When a bus can take a run: layovers, deadheads and break rules.
+
+    Deadhead times are looked up once per station pair and cached for the
+    duration of one ``schedule_buses`` call.
+    """
+
+    def __init__(self, regime: str, min_layover_time: int, min_break_extension: int,
+                 max_continuous_time: Optional[float], terminal_layovers: Dict[str, int],
+                 srt: Optional[SRTDatabase], deadhead_percentile: float = SRT_DEADHEAD_PERCENTILE):
+        # Use custom continuous limit if provided, otherwise use regulation default
+        if max_continuous_time is not None:
+            self.continuous_limit = max_continuous_time
+        else:
+            self.continuous_limit = 4.5 if regime == 'EU' else 5.5
+        self.break_minutes = (45 if regime == 'EU' else 30) + min_break_extension
+        self.dead_time_minutes = min_layover_time
+        # Gaps after which a bus can take a run from the same terminal, and
+        # any run with a break if it needs one
+        self.layover_gap = timedelta(minutes=self.dead_time_minutes)
+        self.rest_gap = timedelta(minutes=self.dead_time_minutes + self.break_minutes)
+        self.terminal_layovers = terminal_layovers
+        self.srt = srt
+        self.deadhead_percentile = deadhead_percentile
+        self._travel: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+
+    def travel_time(self, last_run: Run, run: Run) -> int:
+        if not last_run.stops or not run.stops:
+            return 0
+        pair = (last_run.stops[-1], run.stops[0])
+        times = self._travel.get(pair)
+        if times is None:
+            times = self._travel[pair] = travel_times_by_band(pair[0], pair[1], self.srt, self.deadhead_percentile)
+        return times[time_band(run.start.hour * 60 + run.start.minute)]
+
+    def ready_time(self, last_run: Run, driving_hours: float, run: Run) -> datetime:
+        """Earliest start for ``run`` on a bus that last drove ``last_run``.
+
+        ``driving_hours`` is the bus's driving time so far; if ``run`` would
+        take it over the continuous limit a break is needed first.
+        """
+        if driving_hours + run.duration_hours > self.continuous_limit:
+            # Bus available after last run + dead time + break time
+            return last_run.end + timedelta(minutes=self.dead_time_minutes + self.break_minutes)
+        travel_time = self.travel_time(last_run, run)
+        if last_run.stops:
+            # Use the end terminal of the last run for layover calculation; travel
+            # time accounts for deadheading, so the longer of the two applies
+            terminal_layover = get_layover_time_for_terminal(last_run.stops[-1], self.terminal_layovers,
+                                                             self.dead_time_minutes)
+            return last_run.end + timedelta(minutes=max(terminal_layover, travel_time))
+        # No stop info, use default layover + estimated travel time
+        return last_run.end + timedelta(minutes=self.dead_time_minutes + travel_time)
+
+
+def schedule_buses(runs: List[Run], regime: str, min_layover_time: int = 15, 
+                  min_break_extension: int = 0, max_continuous_time: Optional[float] = None,
+                  prefer_alternating: bool = True, terminal_layovers: Dict[str, int] = None,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  srt: Optional[SRTDatabase] = None, strategy: str = FIRST_FIT,
+                  lookahead: int = SCORED_LOOKAHEAD,
+                  deadhead_percentile: float = SRT_DEADHEAD_PERCENTILE) -> List[BusAssignment]:
+    """Assign runs to buses, respecting breaks, regime rules, and custom configuration.
+
+    With the ``first_fit`` strategy each run goes to the first bus that is
+    free in time, or the first free bus arriving from the other section if
+    ``prefer_alternating``. The ``scored`` strategy instead weighs the
+    closest free buses (see ``_assign_scored``), looking ``lookahead``
+    departures ahead.
+
+    If given, ``progress`` is called every ``PROGRESS_INTERVAL`` runs and once
+    at the end with the number of runs assigned and buses used so far.
+    Deadhead times come from ``srt`` (default: the shared ``srt_db``), at
+    ``deadhead_percentile`` of the observed running times.
+    """
+    if strategy not in ASSIGNMENT_STRATEGIES:
+        raise ValueError(f"Unknown assignment strategy {strategy!r}")
+    all_runs = sorted(runs, key=lambda r: r.start)
+
+    # Initialize terminal layovers dictionary if not provided
+    if terminal_layovers is None:
+        terminal_layovers = {}
+    rules = _AssignmentRules(regime, min_layover_time, min_break_extension, max_continuous_time,
+                             terminal_layovers, srt, deadhead_percentile)
+    if strategy == SCORED:
+        return _assign_scored(all_runs, rules, prefer_alternating, lookahead, progress)
+
+    buses: List[BusAssignment] = []
+    # Driving hours so far of each bus, by position in ``buses``
+    driving: List[float] = []
+    assigned = set()
+
+    for run in all_runs:
+        if run.run_id in assigned:
+            continue
+        
+        best_bus = None
+        for index, bus in enumerate(buses):
+            # Check if bus is available and prefer alternating inbound/outbound
+            if rules.ready_time(bus.runs[-1], driving[index], run) <= run.start:
+                # Prefer alternating sections to minimize dead runs (if enabled)
+                if prefer_alternating and bus.runs[-1].section != run.section:
+                    best_bus = index
+                    break
+                elif best_bus is None:
+                    best_bus = index
+        
+        if best_bus is not None:
+            buses[best_bus].runs.append(run)
+            driving[best_bus] += run.duration_hours
+        else:
+            new_bus = BusAssignment(bus_id=len(buses) + 1)
+            new_bus.runs.append(run)
+            buses.append(new_bus)
+            driving.append(run.duration_hours)
+        assigned.add(run.run_id)
+        
+        if progress is not None and len(assigned) % PROGRESS_INTERVAL == 0:
+            progress(len(assigned), len(buses))
+    
+    if progress is not None:
+        progress(len(assigned), len(buses))
+    return buses
+
+
+def _assign_scored(all_runs: List[Run], rules: _AssignmentRules, prefer_alternating: bool, lookahead: int,
+                   progress: Optional[Callable[[int, int], None]]) -> List[BusAssignment]:
+    """Scoring-based assignment over an availability index.
+
+    Buses are kept sorted by the end of their last run. For each run the
+    index is walked back from the run's start, skipping buses that cannot
+    make it, until ``SCORED_CANDIDATES`` feasible buses are found. Each scan
+    inspects at most ``SCORED_SCAN_LIMIT`` entries; when one falls short the
+    next starts further back, at buses that finished a minimum layover
+    earlier and then at those that finished a layover plus a break earlier
+    (which can take the run even if it needs a break first). Each candidate
+    is scored in minutes (lower is better):
+
+    * idle gap between the bus being ready and the run starting,
+    * deadhead minutes from the SRT, times ``DEADHEAD_WEIGHT``,
+    * continuous-driving headroom the bus would have left, up to
+      ``HEADROOM_WEIGHT``: driving time accumulates per bus, so runs go
+      preferably to buses that have used theirs, keeping fresh buses for
+      tight connections,
+    * ``ALTERNATING_BONUS`` off when alternating sections is preferred,
+    * ``LOOKAHEAD_PENALTY`` for each of the next ``lookahead`` departures
+      that only this candidate could still cover and would no longer
+      reach after taking the run.
+
+    Work per run is bounded by the scan, candidate and lookahead limits.
+    """
+    buses: List[BusAssignment] = []
+    driving: List[float] = []
+    # (end of last run, bus position) sorted by time: the availability index
+    available: List[Tuple[datetime, int]] = []
+    assigned = set()
+
+    for position, run in enumerate(all_runs):
+        if run.run_id in assigned:
+            continue
+
+        candidates: List[Tuple[int, datetime]] = []
+        index = bisect.bisect_right(available, (run.start, len(buses)))
+        # Recently freed buses first, then those past a layover, then those
+        # that have had time for a break
+        for top in (index, bisect.bisect_right(available, (run.start - rules.layover_gap, len(buses))),
+                    bisect.bisect_right(available, (run.start - rules.rest_gap, len(buses)))):
+            index = min(top, index)
+            stop = max(0, index - SCORED_SCAN_LIMIT)
+            while index > stop and len(candidates) < SCORED_CANDIDATES:
+                index -= 1
+                bus_index = available[index][1]
+                ready = rules.ready_time(buses[bus_index].runs[-1], driving[bus_index], run)
+                if ready <= run.start:
+                    candidates.append((bus_index, ready))
+
+        best_bus = None
+        if candidates:
+            upcoming = [later for later in all_runs[position + 1:position + 1 + lookahead]
+                        if later.run_id not in assigned]
+            best_score = None
+            for bus_index, ready in candidates:
+                last_run = buses[bus_index].runs[-1]
+                headroom = max(0.0, rules.continuous_limit - driving[bus_index] - run.duration_hours)
+                score = ((run.start - ready).total_seconds() / 60
+                         + DEADHEAD_WEIGHT * rules.travel_time(last_run, run)
+                         + HEADROOM_WEIGHT * headroom / rules.continuous_limit)
+                if prefer_alternating and last_run.section != run.section:
+                    score -= ALTERNATING_BONUS
+                for later in upcoming:
+                    if (rules.ready_time(last_run, driving[bus_index], later) <= later.start
+                            and rules.ready_time(run, driving[bus_index] + run.duration_hours,
+                                                 later) > later.start
+                            and not any(rules.ready_time(buses[other].runs[-1], driving[other], later)
+                                        <= later.start for other, _ in candidates if other != bus_index)):
+                        score += LOOKAHEAD_PENALTY
+                if best_score is None or score < best_score:
+                    best_bus, best_score = bus_index, score
+
+        if best_bus is not None:
+            bus = buses[best_bus]
+            del available[bisect.bisect_left(available, (bus.runs[-1].end, best_bus))]
+            bus.runs.append(run)
+            driving[best_bus] += run.duration_hours
+        else:
+            best_bus = len(buses)
+            bus = BusAssignment(bus_id=best_bus + 1)
+            bus.runs.append(run)
+            buses.append(bus)
+            driving.append(run.duration_hours)
+        bisect.insort(available, (run.end, best_bus))
+        assigned.add(run.run_id)
+
+        if progress is not None and len(assigned) % PROGRESS_INTERVAL == 0:
+            progress(len(assigned), len(buses))
+
+    if progress is not None:
+        progress(len(assigned), len(buses))
+    return buses
+
+
+def get_layover_time_for_terminal(terminal: str, terminal_layovers: Dict[str, int], default_layover: int) -> int:
+    """Get the layover time for a specific terminal, falling back to default if not specified."""
+    # Clean terminal name to match form field names
+    clean_terminal = terminal.replace(' ', '_').replace('(', '').replace(')', '')
+    return terminal_layovers.get(clean_terminal, default_layover)
+
+
+def departure_minutes(run: Run) -> int:
+    """Minutes after midnight at which ``run`` departs."""
+    return run.start.hour * 60 + run.start.minute
+
+
+def calculate_travel_time_between_runs(last_run: Run, next_run: Run, srt: Optional[SRTDatabase] = None,
+                                       percentile: float = SRT_DEADHEAD_PERCENTILE) -> int:
+    """
+    Calculate travel time between the end of one run and start of another.
+    Returns time in minutes, or 0 if runs connect directly. The SRT value is
+    taken for the time band of ``next_run``'s departure.
+    """
+    if not last_run.stops or not next_run.stops:
+        return 0  # Can't calculate without stop information
+
+    times = travel_times_by_band(last_run.stops[-1], next_run.stops[0], srt, percentile)
+    return times[time_band(departure_minutes(next_run))]
+
+
+def travel_times_by_band(last_end_station: str, next_start_station: str, srt: Optional[SRTDatabase] = None,
+                         percentile: float = SRT_DEADHEAD_PERCENTILE) -> Tuple[int, ...]:
+    """Deadhead minutes between two stations for a departure in each time band."""
+    # If runs connect directly (end station = start station), no travel time needed
+    if last_end_station.lower().strip() == next_start_station.lower().strip():
+        return (0,) * len(TIME_BANDS)
+    
+    # Look up travel time in SRT database; a high percentile rather than the
+    # maximum keeps one bad timetable from inflating every deadhead
+    travel_times = (srt or srt_db).get_band_travel_times(last_end_station, next_start_station,
+                                                         percentile=percentile)
+    
+    if travel_times is not None:
+        return travel_times
+    
+    # If no SRT data available, estimate based on a default speed
+    # This is a fallback - in practice you'd want actual routing data
+    return (15,) * len(TIME_BANDS)  # Default 15 minutes for unknown routes
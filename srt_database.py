@@ -1,148 +1,1108 @@
-"""Simple SRT Database implementation."""
+"""Simple SRT Database implementation.
 
+Shortest running times (SRT) between stations are persisted to a JSON file.
+Next to it a compact binary snapshot (``.srtb``) is written on every save:
+fixed-width records sorted by key plus a string pool, memory-mapped on
+load so that startup costs a single ``mmap`` call and entries are only
+decoded into ``SRTEntry`` objects when they are looked up.
+
+Besides the longest running time ever seen, each entry keeps a compact
+streaming summary of every observed duration (count, mean and a fixed-size
+histogram sketch) so lookups can ask for a percentile instead of the max.
+Timetabled observations are also counted per time-of-day band, so a
+lookup for a given departure time scales that value by how slow the
+segment runs in that band compared with all day.
+
+Nothing is read from disk until the database is first used.
+"""
+
+import bisect
+import hashlib
+import heapq
 import json
+import mmap
 import os
-from datetime import datetime
-from typing import Dict, Optional, List
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping as MappingABC
 from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Optional, List, Mapping, Iterator, NamedTuple, Sequence, Tuple
+
+from time_parsing import MINUTES_PER_DAY, parse_times, segment_durations
+
+
+# Upper bounds (minutes) of the duration sketch buckets: exact minutes where
+# deadheads usually fall, coarser above that, and a final overflow bucket
+_SKETCH_BOUNDS = (
+    tuple(range(1, 31)) + tuple(range(32, 61, 2)) + tuple(range(65, 121, 5))
+    + (135, 150, 180, 240)
+)
+_SKETCH_SIZE = len(_SKETCH_BOUNDS) + 1
+_SKETCH_LOOKUP = bytes(
+    next((i for i, bound in enumerate(_SKETCH_BOUNDS) if minutes <= bound), _SKETCH_SIZE - 1)
+    for minutes in range(_SKETCH_BOUNDS[-1] + 1)
+)
+
+
+class DurationSketch:
+    """Fixed-size histogram of observed durations.
+
+    Memory stays at ``_SKETCH_SIZE`` 32-bit counters however many
+    observations are added. ``add`` returns a new sketch so entries that
+    share one remain immutable.
+    """
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts: Optional[array] = None):
+        self.counts = counts if counts is not None else array('I', bytes(4 * _SKETCH_SIZE))
+
+    def add(self, minutes: int) -> 'DurationSketch':
+        counts = array('I', self.counts)
+        counts[_SKETCH_LOOKUP[max(minutes, 0)] if minutes < len(_SKETCH_LOOKUP) else _SKETCH_SIZE - 1] += 1
+        return DurationSketch(counts)
+
+    def quantile(self, percentile: float, maximum: int) -> int:
+        """Upper bound of the bucket holding ``percentile``, capped at ``maximum``."""
+        total = sum(self.counts)
+        rank = max(1, -(-total * percentile // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(_SKETCH_BOUNDS):
+                    return min(_SKETCH_BOUNDS[index], maximum)
+                break
+        return maximum
+
+    def encode(self) -> str:
+        """Sparse ``bucket:count`` text, e.g. ``"11:3,13:1"``."""
+        return ','.join(f"{index}:{count}" for index, count in enumerate(self.counts) if count)
+
+    @classmethod
+    def decode(cls, text: str) -> 'DurationSketch':
+        counts = array('I', bytes(4 * _SKETCH_SIZE))
+        for item in text.split(','):
+            if item:
+                index, count = item.split(':')
+                counts[int(index)] = int(count)
+        return cls(counts)
+
+    @classmethod
+    def single(cls, minutes: int) -> 'DurationSketch':
+        return cls().add(minutes)
+
+    def merge(self, other: 'DurationSketch') -> 'DurationSketch':
+        """Sketch of the observations in both ``self`` and ``other``."""
+        return DurationSketch(array('I', map(sum, zip(self.counts, other.counts))))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DurationSketch) and self.counts == other.counts
+
+    __hash__ = None
+
+
+# Start minute of each time-of-day band: night, early, AM peak, inter-peak,
+# PM peak, evening, late
+TIME_BANDS = (0, 6 * 60, 7 * 60, 9 * 60 + 30, 15 * 60 + 30, 18 * 60 + 30, 21 * 60)
+TIME_BAND_NAMES = ('night', 'early', 'am_peak', 'inter_peak', 'pm_peak', 'evening', 'late')
 
+# Band observations needed before a band's value is used instead of all-day
+BAND_MIN_SAMPLES = 3
 
-@dataclass
+_BAND_LOOKUP = bytes(bisect.bisect_right(TIME_BANDS, minute) - 1 for minute in range(MINUTES_PER_DAY))
+
+
+def time_band(minutes: int) -> int:
+    """Index into ``TIME_BANDS`` of a time given in minutes after midnight."""
+    return _BAND_LOOKUP[minutes % MINUTES_PER_DAY]
+
+
+class BandSummary:
+    """Observation count and mean duration per time-of-day band.
+
+    Two fixed arrays of ``len(TIME_BANDS)`` entries; ``add`` returns a new
+    summary so entries that share one remain immutable.
+    """
+
+    __slots__ = ('counts', 'means')
+
+    def __init__(self, counts: Optional[array] = None, means: Optional[array] = None):
+        self.counts = counts if counts is not None else array('I', bytes(4 * len(TIME_BANDS)))
+        self.means = means if means is not None else array('f', bytes(4 * len(TIME_BANDS)))
+
+    def add(self, band: int, minutes: int) -> 'BandSummary':
+        counts, means = array('I', self.counts), array('f', self.means)
+        counts[band] += 1
+        means[band] += (minutes - means[band]) / counts[band]
+        return BandSummary(counts, means)
+
+    def merge(self, other: 'BandSummary') -> 'BandSummary':
+        counts, means = array('I', self.counts), array('f', self.means)
+        for band, count in enumerate(other.counts):
+            if count:
+                counts[band] += count
+                means[band] += (other.means[band] - means[band]) * count / counts[band]
+        return BandSummary(counts, means)
+
+    def mean(self, band: int) -> Optional[float]:
+        """Mean duration in ``band``, or None with too few observations."""
+        return self.means[band] if self.counts[band] >= BAND_MIN_SAMPLES else None
+
+    def overall_mean(self) -> float:
+        """Mean duration over all bands (0.0 without observations)."""
+        total = sum(self.counts)
+        return sum(count * mean for count, mean in zip(self.counts, self.means)) / total if total else 0.0
+
+    def encode(self) -> str:
+        """Sparse ``band:count:mean`` text, e.g. ``"2:4:13.5"``."""
+        return ','.join(f"{band}:{count}:{round(self.means[band], 2)}"
+                        for band, count in enumerate(self.counts) if count)
+
+    @classmethod
+    def decode(cls, text: str) -> 'BandSummary':
+        summary = cls()
+        for item in text.split(','):
+            if item:
+                band, count, mean = item.split(':')
+                summary.counts[int(band)] = int(count)
+                summary.means[int(band)] = float(mean)
+        return summary
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BandSummary) and self.counts == other.counts and self.means == other.means
+
+    __hash__ = None
+
+
+@dataclass(frozen=True)
 class SRTEntry:
     from_station: str
     to_station: str
     duration_minutes: int
     last_updated: str
+    samples: int = 0
+    mean_minutes: float = 0.0
+    sketch: Optional[DurationSketch] = None
+    bands: Optional[BandSummary] = None
+
+    def percentile(self, percentile: float) -> int:
+        """Duration at ``percentile`` of observations, or the max if unknown."""
+        if self.sketch is None or not self.samples:
+            return self.duration_minutes
+        return self.sketch.quantile(percentile, self.duration_minutes)
+
+    def banded(self, minutes: int, band: int) -> int:
+        """``minutes`` (an all-day value) adjusted to time band ``band``.
+
+        The value is scaled by the band's mean over the mean of all banded
+        (timetabled) observations and capped at the longest time seen;
+        bands with too few observations keep the all-day value.
+        """
+        if self.bands is None:
+            return minutes
+        band_mean = self.bands.mean(band)
+        overall = self.bands.overall_mean()
+        if band_mean is None or overall <= 0:
+            return minutes
+        return max(1, min(self.duration_minutes, round(minutes * band_mean / overall)))
+
+    def band_times(self, minutes: int) -> Tuple[int, ...]:
+        """``banded(minutes, band)`` for every band, indexed by band."""
+        if self.bands is None:
+            return (minutes,) * len(TIME_BANDS)
+        return tuple(self.banded(minutes, band) for band in range(len(TIME_BANDS)))
+
+    def observe(self, from_station: str, to_station: str, duration_minutes: int,
+                current_time: str, band: Optional[int] = None) -> 'SRTEntry':
+        """Return this entry with one more observed duration folded in.
+
+        ``band`` is the time band of the segment's departure, if known.
+        """
+        samples = self.samples + 1
+        sketch = self.sketch or DurationSketch()
+        bands = self.bands
+        if band is not None:
+            bands = (bands or BandSummary()).add(band, duration_minutes)
+        improved = duration_minutes > self.duration_minutes
+        return SRTEntry(
+            from_station=from_station if improved else self.from_station,
+            to_station=to_station if improved else self.to_station,
+            duration_minutes=duration_minutes if improved else self.duration_minutes,
+            last_updated=current_time,
+            samples=samples,
+            mean_minutes=self.mean_minutes + (duration_minutes - self.mean_minutes) / samples,
+            sketch=sketch.add(duration_minutes),
+            bands=bands
+        )
+
+    def merge(self, other: 'SRTEntry') -> 'SRTEntry':
+        """Return the entry summarizing the observations of both entries."""
+        samples = self.samples + other.samples
+        improved = other.duration_minutes > self.duration_minutes
+        if self.sketch is None or other.sketch is None:
+            sketch = self.sketch or other.sketch
+        else:
+            sketch = self.sketch.merge(other.sketch)
+        if self.bands is None or other.bands is None:
+            bands = self.bands or other.bands
+        else:
+            bands = self.bands.merge(other.bands)
+        return SRTEntry(
+            from_station=other.from_station if improved else self.from_station,
+            to_station=other.to_station if improved else self.to_station,
+            duration_minutes=other.duration_minutes if improved else self.duration_minutes,
+            last_updated=max(self.last_updated, other.last_updated),
+            samples=samples,
+            mean_minutes=(self.mean_minutes * self.samples + other.mean_minutes * other.samples) / samples
+            if samples else 0.0,
+            sketch=sketch,
+            bands=bands
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'from_station': self.from_station,
+            'to_station': self.to_station,
+            'duration_minutes': self.duration_minutes,
+            'last_updated': self.last_updated,
+            'samples': self.samples,
+            'mean_minutes': round(self.mean_minutes, 2),
+            'sketch': self.sketch.encode() if self.sketch else '',
+            'bands': self.bands.encode() if self.bands else ''
+        }
+
+    @classmethod
+    def from_dict(cls, entry_dict: Dict) -> 'SRTEntry':
+        duration = entry_dict['duration_minutes']
+        if 'samples' not in entry_dict:
+            # Entries saved before summaries existed count as one observation
+            return cls(entry_dict['from_station'], entry_dict['to_station'], duration,
+                       entry_dict['last_updated'], 1, float(duration), DurationSketch.single(duration))
+        return cls(
+            from_station=entry_dict['from_station'],
+            to_station=entry_dict['to_station'],
+            duration_minutes=duration,
+            last_updated=entry_dict['last_updated'],
+            samples=entry_dict['samples'],
+            mean_minutes=float(entry_dict['mean_minutes']),
+            sketch=DurationSketch.decode(entry_dict.get('sketch', '')),
+            bands=BandSummary.decode(entry_dict['bands']) if entry_dict.get('bands') else None
+        )
+
+
+# Binary snapshot layout (little endian):
+#   header  magic, version, record size, record count, string pool offset
+#           and length
+#   records key offset, key/from/to/updated/sketch/bands byte lengths,
+#           duration, sample count, mean
+#   strings key|from|to|updated|sketch|bands for each record, UTF-8 encoded
+# Records are sorted by the UTF-8 key so lookups are a binary search.
+_SNAPSHOT_MAGIC = b'SRTB'
+_SNAPSHOT_VERSION = 4
+_HEADER = struct.Struct('<4sHHIII')
+_RECORD = struct.Struct('<IHHHHHHiId')
+
+
+class _BinarySnapshot(MappingABC):
+    """Read-only mapping over a memory-mapped binary snapshot.
+
+    Entries are decoded on first access and cached, so opening a snapshot
+    with hundreds of thousands of segments builds no Python objects.
+    """
+
+    def __init__(self, buffer, count: int, pool_offset: int):
+        self._buffer = buffer
+        self._count = count
+        self._pool_offset = pool_offset
+        self._keys: Optional[List[bytes]] = None
+        self._cache: Dict[int, SRTEntry] = {}
+
+    def _record(self, index: int):
+        return _RECORD.unpack_from(self._buffer, _HEADER.size + index * _RECORD.size)
+
+    def _key_bytes(self, index: int) -> bytes:
+        key_offset, key_len = self._record(index)[:2]
+        start = self._pool_offset + key_offset
+        return bytes(self._buffer[start:start + key_len])
+
+    def _find(self, key: str) -> int:
+        target = key.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_bytes(lo) == target:
+            return lo
+        return -1
+
+    def _entry_at(self, index: int) -> SRTEntry:
+        entry = self._cache.get(index)
+        if entry is None:
+            (key_offset, key_len, from_len, to_len, updated_len, sketch_len, bands_len,
+             duration, samples, mean) = self._record(index)
+            pos = self._pool_offset + key_offset + key_len
+            buf = self._buffer
+            from_station = bytes(buf[pos:pos + from_len]).decode('utf-8')
+            pos += from_len
+            to_station = bytes(buf[pos:pos + to_len]).decode('utf-8')
+            pos += to_len
+            last_updated = bytes(buf[pos:pos + updated_len]).decode('utf-8')
+            pos += updated_len
+            sketch = DurationSketch.decode(bytes(buf[pos:pos + sketch_len]).decode('ascii'))
+            pos += sketch_len
+            bands = BandSummary.decode(bytes(buf[pos:pos + bands_len]).decode('ascii')) if bands_len else None
+            entry = SRTEntry(from_station, to_station, duration, last_updated, samples, mean, sketch, bands)
+            self._cache[index] = entry
+        return entry
+
+    def __getitem__(self, key: str) -> SRTEntry:
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._entry_at(index)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        if self._keys is None:
+            self._keys = [self._key_bytes(i) for i in range(self._count)]
+        return (key.decode('utf-8') for key in self._keys)
+
+    def values(self):
+        return [self._entry_at(i) for i in range(self._count)]
+
+    def items(self):
+        return list(zip(self, self.values()))
+
+
+# How many of the busiest stations each published state keeps ready
+TOP_STATIONS_CACHED = 20
+
+# How many recorded run sets ``update_from_runs`` remembers, so the same
+# submission posted again (e.g. /schedule then /generate) is counted once
+RECORDED_RUN_SETS = 1024
+
+# Station names are indexed by lowercase character n-grams of this length;
+# shorter search terms fall back to the sorted station list
+NGRAM_SIZE = 3
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+
+def _route_order(key: str) -> Tuple[str, str]:
+    """Sort key of an entry key: by from station, then to station.
+
+    Comparing the raw ``from|to`` strings would put ``abbey|x`` before
+    ``ab|x``, because ``|`` sorts after letters.
+    """
+    from_station, _, to_station = key.partition('|')
+    return from_station, to_station
+
+
+def _top_order(item: Tuple[str, int]) -> Tuple[int, str]:
+    """Sort key of a ``(station, degree)`` pair: busiest first, then by name."""
+    return -item[1], item[0]
+
+
+def _ngrams(text: str) -> set:
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class _Aggregates(NamedTuple):
+    station_degree: Mapping[str, int]
+    stations: Tuple[str, ...]
+    top_stations: Tuple[Tuple[str, int], ...]
+    last_updated: Optional[str]
+    # Search index: n-gram -> stations, station -> entry keys, keys in route order
+    station_ngrams: Mapping[str, FrozenSet[str]]
+    stations_lower: Tuple[Tuple[str, str], ...]
+    routes_from: Mapping[str, FrozenSet[str]]
+    routes_to: Mapping[str, FrozenSet[str]]
+    sorted_keys: Tuple[str, ...]
+
+
+class RoutePage(NamedTuple):
+    """One page of a route search, ordered by from and to station."""
+    entries: List[SRTEntry]
+    next_cursor: Optional[str]
+    total: int
+
+
+class _SRTState:
+    """One published version of the database: entries plus aggregates.
+
+    A state loaded from disk derives its aggregates on first use; every
+    later state gets them carried forward incrementally by ``_WorkingState``.
+    """
+
+    def __init__(self, entries: Mapping[str, SRTEntry], aggregates: Optional[_Aggregates] = None,
+                 origin: str = '', serial: int = 0):
+        self.entries = entries
+        self._aggregates = aggregates
+        # Identifies the data loaded from disk, and the writes published since
+        self.origin = origin
+        self.serial = serial
+
+    @property
+    def version(self) -> str:
+        return f"{self.origin}.{self.serial}"
+
+    def successor(self, entries: Mapping[str, SRTEntry], aggregates: Optional[_Aggregates] = None) -> '_SRTState':
+        """The next published state after this one."""
+        return _SRTState(entries, aggregates, self.origin, self.serial + 1)
+
+    def aggregates(self) -> _Aggregates:
+        if self._aggregates is None:
+            self._aggregates = _WorkingState.from_entries(self.entries).freeze(self)._aggregates
+        return self._aggregates
+
+
+class _WorkingState:
+    """Private, mutable copy of a state that a single writer updates."""
+
+    def __init__(self, entries: Dict[str, SRTEntry], station_degree: Dict[str, int],
+                 stations: List[str], last_updated: Optional[str],
+                 station_ngrams: Dict[str, FrozenSet[str]], stations_lower: List[Tuple[str, str]],
+                 routes_from: Dict[str, FrozenSet[str]], routes_to: Dict[str, FrozenSet[str]],
+                 sorted_keys: List[str], top_stations: List[Tuple[str, int]]):
+        self.entries = entries
+        self.station_degree = station_degree
+        self.stations = stations
+        self.last_updated = last_updated
+        self.station_ngrams = station_ngrams
+        self.stations_lower = stations_lower
+        self.routes_from = routes_from
+        self.routes_to = routes_to
+        self.sorted_keys = sorted_keys
+        # The TOP_STATIONS_CACHED busiest stations in _top_order; every
+        # station left out is less busy than the last one kept
+        self.top_stations = top_stations
+
+    @classmethod
+    def from_state(cls, state: _SRTState) -> '_WorkingState':
+        # Posting sets are frozensets, so a shallow copy of each dict is
+        # enough to keep the published state untouched
+        aggregates = state.aggregates()
+        return cls(dict(state.entries), dict(aggregates.station_degree),
+                   list(aggregates.stations), aggregates.last_updated,
+                   dict(aggregates.station_ngrams), list(aggregates.stations_lower),
+                   dict(aggregates.routes_from), dict(aggregates.routes_to),
+                   list(aggregates.sorted_keys), list(aggregates.top_stations))
+
+    @classmethod
+    def from_entries(cls, entries: Mapping[str, SRTEntry]) -> '_WorkingState':
+        station_degree: Dict[str, int] = {}
+        routes_from: Dict[str, set] = {}
+        routes_to: Dict[str, set] = {}
+        last_updated = None
+        for key, entry in entries.items():
+            station_degree[entry.from_station] = station_degree.get(entry.from_station, 0) + 1
+            station_degree[entry.to_station] = station_degree.get(entry.to_station, 0) + 1
+            routes_from.setdefault(entry.from_station, set()).add(key)
+            routes_to.setdefault(entry.to_station, set()).add(key)
+            if last_updated is None or entry.last_updated > last_updated:
+                last_updated = entry.last_updated
+        station_ngrams: Dict[str, set] = {}
+        for station in station_degree:
+            for gram in _ngrams(station.lower()):
+                station_ngrams.setdefault(gram, set()).add(station)
+        return cls(dict(entries), station_degree, sorted(station_degree), last_updated,
+                   {gram: frozenset(names) for gram, names in station_ngrams.items()},
+                   sorted((station.lower(), station) for station in station_degree),
+                   {station: frozenset(keys) for station, keys in routes_from.items()},
+                   {station: frozenset(keys) for station, keys in routes_to.items()},
+                   sorted(entries, key=_route_order),
+                   heapq.nsmallest(TOP_STATIONS_CACHED, station_degree.items(), key=_top_order))
+
+    def get(self, key: str) -> Optional[SRTEntry]:
+        return self.entries.get(key)
+
+    def put(self, key: str, entry: SRTEntry):
+        old_entry = self.entries.get(key)
+        if (old_entry is not None and old_entry.from_station == entry.from_station
+                and old_entry.to_station == entry.to_station):
+            # Same stations: only the entry and the latest update change
+            self.entries[key] = entry
+            if self.last_updated is None or entry.last_updated > self.last_updated:
+                self.last_updated = entry.last_updated
+            return
+        if old_entry is not None:
+            self._release(old_entry.from_station)
+            self._release(old_entry.to_station)
+            self._unlink(self.routes_from, old_entry.from_station, key)
+            self._unlink(self.routes_to, old_entry.to_station, key)
+        else:
+            bisect.insort(self.sorted_keys, key, key=_route_order)
+        self.entries[key] = entry
+        self._retain(entry.from_station)
+        self._retain(entry.to_station)
+        self._link(self.routes_from, entry.from_station, key)
+        self._link(self.routes_to, entry.to_station, key)
+        if self.last_updated is None or entry.last_updated > self.last_updated:
+            self.last_updated = entry.last_updated
+
+    @staticmethod
+    def _link(postings: Dict[str, FrozenSet[str]], name: str, value: str):
+        postings[name] = postings.get(name, _EMPTY) | {value}
+
+    @staticmethod
+    def _unlink(postings: Dict[str, FrozenSet[str]], name: str, value: str):
+        remaining = postings[name] - {value}
+        if remaining:
+            postings[name] = remaining
+        else:
+            del postings[name]
+
+    def _retain(self, station: str):
+        degree = self.station_degree.get(station, 0)
+        if degree == 0:
+            bisect.insort(self.stations, station)
+            bisect.insort(self.stations_lower, (station.lower(), station))
+            for gram in _ngrams(station.lower()):
+                self._link(self.station_ngrams, gram, station)
+        self.station_degree[station] = degree + 1
+        self._raise_top(station, degree + 1)
+
+    def _release(self, station: str):
+        degree = self.station_degree[station] - 1
+        if degree == 0:
+            del self.station_degree[station]
+            del self.stations[bisect.bisect_left(self.stations, station)]
+            del self.stations_lower[bisect.bisect_left(self.stations_lower, (station.lower(), station))]
+            for gram in _ngrams(station.lower()):
+                self._unlink(self.station_ngrams, gram, station)
+        else:
+            self.station_degree[station] = degree
+        self._lower_top(station, degree)
+
+    def _top_index(self, station: str) -> int:
+        for index, (name, _) in enumerate(self.top_stations):
+            if name == station:
+                return index
+        return -1
+
+    def _raise_top(self, station: str, degree: int):
+        """Move ``station`` up the top list after its degree grew."""
+        top = self.top_stations
+        index = self._top_index(station)
+        if index >= 0:
+            del top[index]
+        elif len(top) >= TOP_STATIONS_CACHED and _top_order((station, degree)) > _top_order(top[-1]):
+            return
+        bisect.insort(top, (station, degree), key=_top_order)
+        del top[TOP_STATIONS_CACHED:]
+
+    def _lower_top(self, station: str, degree: int):
+        """Move ``station`` down the top list after its degree shrank (0: gone).
+
+        The list is only rebuilt when the station may have dropped below
+        one that is not in it.
+        """
+        top = self.top_stations
+        index = self._top_index(station)
+        if index < 0:
+            return
+        was_last = index == len(top) - 1
+        del top[index]
+        others_left_out = len(self.station_degree) - (1 if degree else 0) > len(top)
+        if not others_left_out or (degree and not was_last and _top_order((station, degree)) < _top_order(top[-1])):
+            if degree:
+                bisect.insort(top, (station, degree), key=_top_order)
+            return
+        self.top_stations = heapq.nsmallest(TOP_STATIONS_CACHED, self.station_degree.items(), key=_top_order)
+
+    def freeze(self, previous: _SRTState) -> _SRTState:
+        aggregates = _Aggregates(
+            station_degree=MappingProxyType(self.station_degree),
+            stations=tuple(self.stations),
+            top_stations=tuple(self.top_stations),
+            last_updated=self.last_updated,
+            station_ngrams=MappingProxyType(self.station_ngrams),
+            stations_lower=tuple(self.stations_lower),
+            routes_from=MappingProxyType(self.routes_from),
+            routes_to=MappingProxyType(self.routes_to),
+            sorted_keys=tuple(self.sorted_keys)
+        )
+        return previous.successor(MappingProxyType(self.entries), aggregates)
+
+
+class _Observations:
+    """Plain entry dict standing in for ``_WorkingState`` when aggregating
+    runs outside the database (no search aggregates are maintained)."""
+
+    def __init__(self):
+        self.entries: Dict[str, SRTEntry] = {}
+
+    def get(self, key: str) -> Optional[SRTEntry]:
+        return self.entries.get(key)
+
+    def put(self, key: str, entry: SRTEntry):
+        self.entries[key] = entry
 
 
 class SRTDatabase:
-    def __init__(self, database_file: str = "srt_database.json"):
+    """Persistent store of shortest running times between stations.
+
+    Readers always see an immutable snapshot (``data``) and never take a
+    lock. Writers are serialized by ``_write_lock``: they copy the current
+    snapshot, apply their changes and publish the new mapping with a single
+    reference assignment, so a reader holds either the old or the new
+    snapshot but never a half-updated one. Station counts, the sorted
+    station list, the busiest stations and the latest update time are
+    published with each snapshot and maintained incrementally by writers.
+
+    The database is loaded lazily on first use, preferring the binary
+    snapshot when it is at least as new as the JSON file.
+
+    ``update_from_runs`` records a given set of runs only once per process,
+    so resubmitting a timetable neither skews the duration summaries nor
+    publishes a new version.
+    """
+
+    def __init__(self, database_file: str = "srt_database.json", snapshot_file: Optional[str] = None):
         self.database_file = database_file
-        self.data: Dict[str, SRTEntry] = {}
-        self.load_database()
-    
+        self.snapshot_file = snapshot_file or os.path.splitext(database_file)[0] + '.srtb'
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._state: Optional[_SRTState] = None
+        self._recorded: 'OrderedDict[str, None]' = OrderedDict()
+
+    @property
+    def data(self) -> Mapping[str, SRTEntry]:
+        """The current read-only snapshot of all entries."""
+        return self._current()
+
+    def snapshot(self) -> Mapping[str, SRTEntry]:
+        """Return the current snapshot; it never changes once returned."""
+        return self._current()
+
+    @property
+    def version(self) -> str:
+        """Identifier of the current snapshot; it changes with every write."""
+        return self._current_state().version
+
+    def pinned(self) -> 'SRTDatabase':
+        """View of the current snapshot for lookups; later writes do not affect it.
+
+        Lets one request compute its cache key and its schedule from the
+        same data while other requests keep publishing updates.
+        """
+        view = SRTDatabase(self.database_file, self.snapshot_file)
+        view._state = self._current_state()
+        return view
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._state is not None
+
+    def _current_state(self) -> _SRTState:
+        state = self._state
+        if state is None:
+            with self._load_lock:
+                if self._state is None:
+                    self._state = self._load_state()
+                state = self._state
+        return state
+
+    def _current(self) -> Mapping[str, SRTEntry]:
+        return self._current_state().entries
+
+    def _publish(self, working: _WorkingState):
+        self._state = working.freeze(self._current_state())
+
     def _make_key(self, from_station: str, to_station: str) -> str:
         from_norm = from_station.strip().lower()
         to_norm = to_station.strip().lower()
         return f"{from_norm}|{to_norm}"
-    
+
     def load_database(self):
+        """(Re)load the database from disk immediately."""
+        with self._write_lock:
+            self._state = self._load_state()
+
+    def _load_state(self) -> _SRTState:
+        # The file's size and modification time tell loads of different
+        # data apart, including across restarts
+        try:
+            stat = os.stat(self.database_file)
+            origin = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        except OSError:
+            origin = 'new'
+        return _SRTState(self._read_from_disk(), origin=origin)
+
+    def _read_from_disk(self) -> Mapping[str, SRTEntry]:
+        if self._binary_snapshot_is_current():
+            snapshot = self.load_binary_snapshot()
+            if snapshot is not None:
+                return snapshot
+        return MappingProxyType(self._read_json())
+
+    def _binary_snapshot_is_current(self) -> bool:
+        if not os.path.exists(self.snapshot_file):
+            return False
+        if not os.path.exists(self.database_file):
+            return True
+        return os.path.getmtime(self.snapshot_file) >= os.path.getmtime(self.database_file)
+
+    def _read_json(self) -> Dict[str, SRTEntry]:
+        loaded: Dict[str, SRTEntry] = {}
         if os.path.exists(self.database_file):
             try:
                 with open(self.database_file, 'r', encoding='utf-8') as f:
                     raw_data = json.load(f)
-                self.data = {}
                 for key, entry_dict in raw_data.items():
-                    self.data[key] = SRTEntry(**entry_dict)
+                    loaded[key] = SRTEntry.from_dict(entry_dict)
             except Exception as e:
                 print(f"Warning: Could not load SRT database: {e}")
-                self.data = {}
-        else:
-            self.data = {}
-    
-    def save_database(self):
+                loaded = {}
+        return loaded
+
+    def load_binary_snapshot(self) -> Optional[Mapping[str, SRTEntry]]:
+        """Memory-map the binary snapshot, or return None if it is unusable.
+
+        A snapshot whose records or string pool extend past the end of the
+        file (e.g. truncated by a full disk) is unusable too.
+        """
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < _HEADER.size:
+                    return None
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size, count, pool_offset, pool_len = _HEADER.unpack_from(buffer, 0)
+            if (magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION or record_size != _RECORD.size
+                    or pool_offset < _HEADER.size + count * _RECORD.size or size < pool_offset + pool_len):
+                buffer.close()
+                return None
+            return _BinarySnapshot(buffer, count, pool_offset)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Warning: Could not load SRT snapshot: {e}")
+            return None
+
+    def save_binary_snapshot(self, snapshot: Optional[Mapping[str, SRTEntry]] = None):
+        """Write ``snapshot`` (default: the current one) as a binary snapshot."""
+        if snapshot is None:
+            snapshot = self._current()
+        try:
+            records = []
+            pool = bytearray()
+            for key in sorted(snapshot, key=lambda k: k.encode('utf-8')):
+                entry = snapshot[key]
+                sketch = entry.sketch.encode() if entry.sketch else ''
+                bands = entry.bands.encode() if entry.bands else ''
+                parts = [s.encode('utf-8') for s in (key, entry.from_station, entry.to_station,
+                                                     entry.last_updated, sketch, bands)]
+                records.append(_RECORD.pack(len(pool), *(len(p) for p in parts), entry.duration_minutes,
+                                            entry.samples, entry.mean_minutes))
+                for part in parts:
+                    pool += part
+            pool_offset = _HEADER.size + len(records) * _RECORD.size
+            tmp_file = f"{self.snapshot_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, _RECORD.size, len(records), pool_offset,
+                                     len(pool)))
+                f.write(b''.join(records))
+                f.write(pool)
+            os.replace(tmp_file, self.snapshot_file)
+        except Exception as e:
+            print(f"Warning: Could not save SRT snapshot: {e}")
+
+    def save_database(self, snapshot: Optional[Mapping[str, SRTEntry]] = None):
+        if snapshot is None:
+            snapshot = self._current()
         try:
             raw_data = {}
-            for key, entry in self.data.items():
-                raw_data[key] = {
-                    'from_station': entry.from_station,
-                    'to_station': entry.to_station,
-                    'duration_minutes': entry.duration_minutes,
-                    'last_updated': entry.last_updated
-                }
-            with open(self.database_file, 'w', encoding='utf-8') as f:
+            for key, entry in snapshot.items():
+                raw_data[key] = entry.to_dict()
+            # Write to a temporary file and swap it in so a crash or a
+            # concurrent reader never sees a truncated database file
+            tmp_file = f"{self.database_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(raw_data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.database_file)
         except Exception as e:
             print(f"Warning: Could not save SRT database: {e}")
-    
-    def get_travel_time(self, from_station: str, to_station: str) -> Optional[int]:
+            return
+        self.save_binary_snapshot(snapshot)
+
+    def get_travel_time(self, from_station: str, to_station: str,
+                        percentile: Optional[float] = None,
+                        departure_minutes: Optional[int] = None) -> Optional[int]:
+        """Travel time between two stations.
+
+        Returns the longest time ever observed, or the given percentile of
+        all observations (e.g. ``85``) when ``percentile`` is set. With
+        ``departure_minutes`` (minutes after midnight) the value is adjusted
+        to that time's band, see ``SRTEntry.banded``.
+        """
         key = self._make_key(from_station, to_station)
-        entry = self.data.get(key)
-        return entry.duration_minutes if entry else None
-    
-    def update_travel_time(self, from_station: str, to_station: str, duration_minutes: int):
+        entry = self._current().get(key)
+        if entry is None:
+            return None
+        minutes = entry.duration_minutes if percentile is None else entry.percentile(percentile)
+        if departure_minutes is None:
+            return minutes
+        return entry.banded(minutes, time_band(departure_minutes))
+
+    def get_band_travel_times(self, from_station: str, to_station: str,
+                              percentile: Optional[float] = None) -> Optional[Tuple[int, ...]]:
+        """``get_travel_time`` for a departure in each time band, indexed by band.
+
+        One lookup answers every departure time between the two stations,
+        for callers that cache per station pair.
+        """
+        entry = self._current().get(self._make_key(from_station, to_station))
+        if entry is None:
+            return None
+        return entry.band_times(entry.duration_minutes if percentile is None else entry.percentile(percentile))
+
+    def _apply_update(self, working: _WorkingState, from_station: str, to_station: str,
+                      duration_minutes: int, current_time: str, band: Optional[int] = None):
+        """Record one observed duration in ``working``.
+
+        ``band`` is the time band of the departure, for timetabled segments.
+        """
         key = self._make_key(from_station, to_station)
-        current_time = datetime.now().isoformat()
-        
-        existing_entry = self.data.get(key)
-        if existing_entry is None or duration_minutes > existing_entry.duration_minutes:
-            self.data[key] = SRTEntry(
+        existing_entry = working.get(key)
+        if existing_entry is None:
+            working.put(key, SRTEntry(
                 from_station=from_station,
                 to_station=to_station,
                 duration_minutes=duration_minutes,
-                last_updated=current_time
-            )
-            self.save_database()
-    
+                last_updated=current_time,
+                samples=1,
+                mean_minutes=float(duration_minutes),
+                sketch=DurationSketch.single(duration_minutes),
+                bands=BandSummary().add(band, duration_minutes) if band is not None else None
+            ))
+        else:
+            working.put(key, existing_entry.observe(from_station, to_station, duration_minutes, current_time,
+                                                    band))
+
+    def update_travel_time(self, from_station: str, to_station: str, duration_minutes: int):
+        with self._write_lock:
+            working = _WorkingState.from_state(self._current_state())
+            self._apply_update(working, from_station, to_station, duration_minutes, datetime.now().isoformat())
+            self._publish(working)
+            self.save_database(working.entries)
+
+    @staticmethod
+    def _has_timetable(run) -> bool:
+        return bool(getattr(run, 'stop_times', None)) and len(run.stop_times) == len(run.stops)
+
+    @classmethod
+    def runs_key(cls, runs: List) -> str:
+        """Fingerprint of everything ``update_from_runs`` reads from ``runs``."""
+        observed = [(run.stops, run.stop_times if cls._has_timetable(run) else None,
+                     run.start.isoformat(), run.end.isoformat()) for run in runs]
+        return hashlib.blake2b(repr(observed).encode('utf-8'), digest_size=16).hexdigest()
+
     def update_from_runs(self, runs: List):
+        # All runs of one submission are applied as a single write so the
+        # snapshot is copied and the file saved at most once per call
+        key = self.runs_key(runs)
+        with self._write_lock:
+            if key in self._recorded:
+                self._recorded.move_to_end(key)
+                return
+            self._recorded[key] = None
+            if len(self._recorded) > RECORDED_RUN_SETS:
+                self._recorded.popitem(last=False)
+            working = _WorkingState.from_state(self._current_state())
+            if self._observe_runs(working, runs, datetime.now().isoformat()):
+                self._publish(working)
+                self.save_database(working.entries)
+
+    def aggregate_runs(self, runs: List, current_time: Optional[str] = None) -> Dict[str, SRTEntry]:
+        """Entries observed in ``runs`` alone, as ``update_from_runs`` would
+        record them, without reading or changing the database."""
+        observations = _Observations()
+        self._observe_runs(observations, runs, current_time or datetime.now().isoformat())
+        return observations.entries
+
+    def merge_entries(self, entries: Mapping[str, SRTEntry]) -> int:
+        """Fold entries from ``aggregate_runs`` into the database in one write.
+
+        The merged snapshot is published and saved once; its search
+        aggregates are rebuilt on first use. Returns the number of keys that
+        were not in the database before.
+        """
+        if not entries:
+            return 0
+        with self._write_lock:
+            merged = dict(self._current())
+            added = 0
+            for key, entry in entries.items():
+                existing = merged.get(key)
+                if existing is None:
+                    added += 1
+                    merged[key] = entry
+                else:
+                    merged[key] = existing.merge(entry)
+            self._state = self._current_state().successor(MappingProxyType(merged))
+            self.save_database(self._state.entries)
+        return added
+
+    def _observe_runs(self, working, runs: List, current_time: str) -> bool:
+        """Record the segment times of ``runs`` in ``working``; return True if
+        any segment was recorded."""
+        runs = [run for run in runs if len(run.stops) >= 2]
+
+        # Parse the stop times of every timetabled run in one batch
+        flat_times = []
+        for run in runs:
+            if self._has_timetable(run):
+                flat_times.extend(run.stop_times)
+        parsed = parse_times(flat_times)
+        failed_rows = {index for index, _ in parsed.errors}
+
+        changed = False
+        offset = 0
         for run in runs:
-            if len(run.stops) < 2:
-                continue
-            
             # Check if run has timing data for each stop
-            if hasattr(run, 'stop_times') and run.stop_times and len(run.stop_times) == len(run.stops):
-                self._update_from_timetable(run.stops, run.stop_times)
+            if self._has_timetable(run):
+                end = offset + len(run.stop_times)
+                stop_minutes = parsed.minutes[offset:end]
+                stop_seconds = parsed.seconds[offset:end] if parsed.seconds is not None else None
+                if failed_rows and not failed_rows.isdisjoint(range(offset, end)):
+                    stop_minutes = None
+                offset = end
+                changed |= self._update_from_timetable(working, run.stops, stop_minutes, current_time,
+                                                       stop_seconds)
             else:
-                self._update_from_duration_only(run)
-    
-    def _update_from_timetable(self, stops: List[str], stop_times: List[str]):
-        from datetime import timedelta
-        
-        parsed_times = []
-        for time_str in stop_times:
-            try:
-                if len(time_str.split(':')) == 2:
-                    time_obj = datetime.strptime(time_str, '%H:%M')
-                else:
-                    time_obj = datetime.strptime(time_str, '%H:%M:%S')
-                parsed_times.append(time_obj)
-            except (ValueError, AttributeError):
-                return self._update_from_duration_only_with_stops(stops, len(stops) * 17)
-        
-        for i in range(len(stops) - 1):
-            from_station = stops[i]
-            to_station = stops[i + 1]
-            
-            time_diff = parsed_times[i + 1] - parsed_times[i]
-            if time_diff.total_seconds() < 0:
-                time_diff += timedelta(days=1)
-            
-            duration_minutes = int(time_diff.total_seconds() / 60)
+                changed |= self._update_from_duration_only(working, run, current_time)
+        return changed
+
+    def _update_from_timetable(self, working: _WorkingState, stops: List[str],
+                               stop_minutes: Optional[Sequence[int]], current_time: str,
+                               stop_seconds: Optional[Sequence[int]] = None) -> bool:
+        """Record segment times from parsed stop times (None if unparseable).
+
+        Segments are measured to the second when ``stop_seconds`` is given.
+        Each segment is also counted in the time band of its departure.
+        """
+        if stop_minutes is None:
+            return self._update_from_duration_only_with_stops(working, stops, len(stops) * 17, current_time)
+
+        changed = False
+        for i, duration_minutes in enumerate(segment_durations(stop_minutes, stop_seconds)):
             if 1 <= duration_minutes <= 120:
-                self.update_travel_time(from_station, to_station, duration_minutes)
-    
-    def _update_from_duration_only(self, run):
+                self._apply_update(working, stops[i], stops[i + 1], duration_minutes, current_time,
+                                   _BAND_LOOKUP[stop_minutes[i] % MINUTES_PER_DAY])
+                changed = True
+        return changed
+
+    def _update_from_duration_only(self, working: _WorkingState, run, current_time: str) -> bool:
         total_duration_minutes = int((run.end - run.start).total_seconds() / 60)
-        num_segments = len(run.stops) - 1
-        if num_segments > 0:
-            time_per_segment = total_duration_minutes // num_segments
-            for i in range(len(run.stops) - 1):
-                from_station = run.stops[i]
-                to_station = run.stops[i + 1]
-                self.update_travel_time(from_station, to_station, time_per_segment)
-    
-    def _update_from_duration_only_with_stops(self, stops: List[str], total_duration_minutes: int):
+        return self._update_from_duration_only_with_stops(working, run.stops, total_duration_minutes, current_time)
+
+    def _update_from_duration_only_with_stops(self, working: _WorkingState, stops: List[str],
+                                              total_duration_minutes: int, current_time: str) -> bool:
         num_segments = len(stops) - 1
         if num_segments > 0:
             time_per_segment = total_duration_minutes // num_segments
             for i in range(len(stops) - 1):
                 from_station = stops[i]
                 to_station = stops[i + 1]
-                self.update_travel_time(from_station, to_station, time_per_segment)
-    
+                self._apply_update(working, from_station, to_station, time_per_segment, current_time)
+        return num_segments > 0
+
     def get_all_stations(self) -> List[str]:
-        stations = set()
-        for entry in self.data.values():
-            stations.add(entry.from_station)
-            stations.add(entry.to_station)
-        return sorted(list(stations))
-    
+        return list(self._current_state().aggregates().stations)
+
+    def get_station_frequency(self, station: str) -> int:
+        """Number of entries that start or end at ``station``."""
+        return self._current_state().aggregates().station_degree.get(station, 0)
+
+    def get_top_stations(self, limit: int = 6) -> List[Tuple[str, int]]:
+        """The ``limit`` stations appearing in the most entries, busiest first."""
+        aggregates = self._current_state().aggregates()
+        if limit <= TOP_STATIONS_CACHED:
+            return list(aggregates.top_stations[:limit])
+        return heapq.nsmallest(limit, aggregates.station_degree.items(), key=_top_order)
+
+    @staticmethod
+    def _match_stations(aggregates: _Aggregates, query: str) -> List[str]:
+        """Stations whose name contains ``query`` (case-insensitive), sorted."""
+        needle = query.strip().lower()
+        if len(needle) < NGRAM_SIZE:
+            return [name for lower, name in aggregates.stations_lower if needle in lower]
+        postings = [aggregates.station_ngrams.get(gram, _EMPTY) for gram in _ngrams(needle)]
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return sorted(name for name in candidates if needle in name.lower())
+
+    def search_stations(self, query: str, limit: int = 10) -> List[str]:
+        """Station names for typeahead: prefix matches first, then substrings."""
+        aggregates = self._current_state().aggregates()
+        needle = query.strip().lower()
+        if not needle:
+            return [name for _, name in aggregates.stations_lower[:limit]]
+        stations_lower = aggregates.stations_lower
+        results = []
+        index = bisect.bisect_left(stations_lower, (needle, ''))
+        while index < len(stations_lower) and len(results) < limit:
+            lower, name = stations_lower[index]
+            if not lower.startswith(needle):
+                break
+            results.append(name)
+            index += 1
+        if len(results) < limit:
+            seen = set(results)
+            for name in self._match_stations(aggregates, needle):
+                if name not in seen:
+                    results.append(name)
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def search_routes(self, from_query: str = '', to_query: str = '',
+                      cursor: Optional[str] = None, limit: int = 100) -> RoutePage:
+        """Entries whose stations contain the queries, one page at a time.
+
+        Results are ordered by from station, then to station; pass the
+        returned ``next_cursor`` back in to fetch the following page.
+        """
+        state = self._current_state()
+        aggregates = state.aggregates()
+        if from_query or to_query:
+            keys = None
+            for query, postings in ((from_query, aggregates.routes_from), (to_query, aggregates.routes_to)):
+                if not query:
+                    continue
+                matched = set()
+                for station in self._match_stations(aggregates, query):
+                    matched |= postings.get(station, _EMPTY)
+                keys = matched if keys is None else keys & matched
+            keys = sorted(keys, key=_route_order)
+        else:
+            keys = aggregates.sorted_keys
+        start = bisect.bisect_right(keys, _route_order(cursor), key=_route_order) if cursor else 0
+        page_keys = keys[start:start + limit]
+        next_cursor = page_keys[-1] if page_keys and start + limit < len(keys) else None
+        return RoutePage([state.entries[key] for key in page_keys], next_cursor, len(keys))
+
     def get_statistics(self) -> Dict:
+        state = self._current_state()
+        aggregates = state.aggregates()
         return {
-            'total_entries': len(self.data),
-            'total_stations': len(self.get_all_stations()),
-            'last_updated': max([entry.last_updated for entry in self.data.values()]) if self.data else None
+            'total_entries': len(state.entries),
+            'total_stations': len(aggregates.stations),
+            'last_updated': aggregates.last_updated
         }
 
 
+# Constructing the database is cheap; the file is read on first use
 srt_db = SRTDatabase()
@@ -0,0 +1,149 @@
+"""Bulk-load historical timetables into the SRT database.
+
+Usage::
+
+    python srt_ingest.py [--database srt_database.json] [--workers N] PATH [PATH ...]
+
+Each PATH is a timetable file or a directory searched for ``.csv`` and
+``.json`` timetables (see ``timetable_files``). Files are split into shards
+balanced by size and handed to a process pool; every worker folds its
+shard into local per-segment entries with the same rules as
+``SRTDatabase.update_from_runs``. The parent merges the shard results and
+applies them to the database in a single write, so the JSON file and the
+binary snapshot are saved exactly once however many runs are loaded.
+"""
+
+import argparse
+import csv
+import heapq
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Sequence
+
+from srt_database import SRTDatabase, SRTEntry
+from timetable_files import find_timetables, load_runs
+
+# Shards per worker process; more shards even out uneven file sizes
+SHARDS_PER_WORKER = 4
+
+
+class ShardResult(NamedTuple):
+    """Segment entries aggregated from one shard of timetable files."""
+    entries: Dict[str, SRTEntry]
+    files: int
+    runs: int
+    errors: List[str]
+
+
+def merge_into(target: Dict[str, SRTEntry], entries: Dict[str, SRTEntry]):
+    """Fold ``entries`` into ``target`` in place."""
+    for key, entry in entries.items():
+        existing = target.get(key)
+        target[key] = entry if existing is None else existing.merge(entry)
+
+
+def ingest_shard(paths: Sequence[str], current_time: str) -> ShardResult:
+    """Worker body: aggregate the segment times of every run in ``paths``."""
+    # Only used for its aggregation rules; the database file is never read
+    database = SRTDatabase()
+    entries: Dict[str, SRTEntry] = {}
+    runs = 0
+    errors: List[str] = []
+    for path in paths:
+        try:
+            file_runs = load_runs(path)
+        except (OSError, ValueError, csv.Error) as e:
+            errors.append(f"{path}: {e}")
+            continue
+        merge_into(entries, database.aggregate_runs(file_runs, current_time))
+        runs += len(file_runs)
+    return ShardResult(entries, len(paths) - len(errors), runs, errors)
+
+
+def make_shards(paths: Sequence[str], count: int) -> List[List[str]]:
+    """Split ``paths`` into ``count`` shards of roughly equal total size."""
+    shards: List[List[str]] = [[] for _ in range(max(1, min(count, len(paths))))]
+    heap = [(0, index) for index in range(len(shards))]
+    for size, path in sorted(((os.path.getsize(path), path) for path in paths), reverse=True):
+        total, index = heapq.heappop(heap)
+        shards[index].append(path)
+        heapq.heappush(heap, (total + size, index))
+    return [shard for shard in shards if shard]
+
+
+def ingest(paths: Sequence[str], database: SRTDatabase, workers: int) -> Dict:
+    """Load every timetable in ``paths`` into ``database`` and return statistics."""
+    started = time.perf_counter()
+    files = []
+    missing = []
+    for path in find_timetables(paths):
+        if os.path.isfile(path):
+            files.append(path)
+        else:
+            missing.append(f"{path}: no such file")
+    current_time = datetime.now().isoformat()
+    shards = make_shards(files, workers * SHARDS_PER_WORKER) if files else []
+
+    merged: Dict[str, SRTEntry] = {}
+    totals = {'files': 0, 'runs': 0, 'errors': missing}
+
+    def collect(result: ShardResult):
+        merge_into(merged, result.entries)
+        totals['files'] += result.files
+        totals['runs'] += result.runs
+        totals['errors'].extend(result.errors)
+
+    if workers <= 1:
+        for shard in shards:
+            collect(ingest_shard(shard, current_time))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(ingest_shard, shard, current_time) for shard in shards]
+            for future in as_completed(futures):
+                collect(future.result())
+    aggregated = time.perf_counter()
+
+    new_routes = database.merge_entries(merged)
+    finished = time.perf_counter()
+
+    segments = sum(entry.samples for entry in merged.values())
+    elapsed = finished - started
+    return {
+        'files': totals['files'],
+        'runs': totals['runs'],
+        'segments': segments,
+        'routes': len(merged),
+        'new_routes': new_routes,
+        'total_routes': len(database.data),
+        'errors': totals['errors'],
+        'aggregate_seconds': aggregated - started,
+        'write_seconds': finished - aggregated,
+        'elapsed_seconds': elapsed,
+        'segments_per_second': segments / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-load historical timetables into the SRT database.")
+    parser.add_argument('paths', nargs='+', help="timetable files or directories")
+    parser.add_argument('--database', default='srt_database.json', help="SRT database JSON file")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    args = parser.parse_args(argv)
+
+    stats = ingest(args.paths, SRTDatabase(args.database), max(1, args.workers))
+    for error in stats['errors']:
+        print(f"Skipped {error}", file=sys.stderr)
+    print(f"Ingested {stats['segments']} segments from {stats['runs']} runs in {stats['files']} files "
+          f"using {max(1, args.workers)} workers")
+    print(f"{stats['routes']} routes observed, {stats['new_routes']} new, "
+          f"{stats['total_routes']} in database")
+    print(f"Aggregated in {stats['aggregate_seconds']:.2f}s, written in {stats['write_seconds']:.2f}s, "
+          f"{stats['segments_per_second']:.0f} segments/s overall")
+    return 1 if stats['errors'] and not stats['files'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Batch parsing of clock times into minutes since midnight.
+
+``datetime.strptime`` costs several microseconds per call, which adds up
+when every stop time of every run in a submission is parsed. Times are
+instead converted a whole list at a time: ``HH:MM`` strings (the common
+case) are resolved through a precomputed lookup table, and only
+``HH:MM:SS`` values fall back to splitting and integer conversion.
+
+Accepted values match what ``strptime('%H:%M')`` / ``strptime('%H:%M:%S')``
+accepted before: one or two ASCII digit fields within the normal clock ranges.
+"""
+
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+# Marks rows of a ParsedTimes.minutes array that could not be parsed
+INVALID = -1
+
+
+def _build_table() -> Dict[str, int]:
+    table = {}
+    for hour in range(24):
+        for minute in range(60):
+            value = hour * 60 + minute
+            for hour_text in {str(hour), f"{hour:02d}"}:
+                for minute_text in {str(minute), f"{minute:02d}"}:
+                    table[f"{hour_text}:{minute_text}"] = value
+    return table
+
+
+_HH_MM = _build_table()
+
+# strptime anchors bare clock times on 1900-01-01; keep the same anchor
+_CLOCK_ANCHOR = datetime(1900, 1, 1)
+_CLOCK = [_CLOCK_ANCHOR + timedelta(minutes=minute) for minute in range(MINUTES_PER_DAY)]
+
+
+class ParsedTimes(NamedTuple):
+    """Result of a batch parse.
+
+    ``minutes`` has one entry per input value (``INVALID`` where parsing
+    failed) and ``errors`` lists ``(row index, value)`` for each failure.
+    ``seconds`` holds the seconds field of each row, or is None when no
+    row had one.
+    """
+    minutes: array
+    errors: List[Tuple[int, object]]
+    seconds: Optional[array] = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _parse_with_seconds(value) -> int:
+    """Seconds since midnight of an ``HH:MM:SS`` value, or ``INVALID``."""
+    parts = value.split(':')
+    if len(parts) != 3 or not all(1 <= len(part) <= 2 and part.isascii() and part.isdigit()
+                                  for part in parts):
+        return INVALID
+    hour, minute, second = int(parts[0]), int(parts[1]), int(parts[2])
+    if hour > 23 or minute > 59 or second > 59:
+        return INVALID
+    return (hour * 60 + minute) * 60 + second
+
+
+def parse_times(values: Sequence[str], allow_seconds: bool = True) -> ParsedTimes:
+    """Parse clock times into whole minutes since midnight in one pass.
+
+    Seconds are accepted when ``allow_seconds`` is set; ``minutes`` holds
+    the whole minute and ``seconds`` the remainder. Invalid or non-string values are reported per row rather than
+    raising, so callers can decide whether to skip a row or the whole batch.
+    """
+    lookup = _HH_MM.get
+    minutes = array('i', [lookup(value, INVALID) if value.__class__ is str else INVALID
+                          for value in values])
+    errors = []
+    seconds = None
+    if INVALID in minutes:
+        for index, value in enumerate(values):
+            if minutes[index] != INVALID:
+                continue
+            if allow_seconds and isinstance(value, str):
+                clock_seconds = _parse_with_seconds(value)
+                if clock_seconds != INVALID:
+                    if seconds is None:
+                        seconds = array('b', bytes(len(minutes)))
+                    minutes[index], seconds[index] = divmod(clock_seconds, 60)
+                    continue
+            errors.append((index, value))
+    return ParsedTimes(minutes, errors, seconds)
+
+
+def segment_durations(minutes: Sequence[int], seconds: Optional[Sequence[int]] = None) -> array:
+    """Whole minutes between consecutive times, wrapping past midnight.
+
+    With ``seconds`` the difference is taken to the second before it is
+    truncated, so 08:00:50 to 08:02:10 is one minute.
+    """
+    if seconds is None:
+        return array('i', [(minutes[i + 1] - minutes[i]) % MINUTES_PER_DAY for i in range(len(minutes) - 1)])
+    clock = [minute * 60 + second for minute, second in zip(minutes, seconds)]
+    return array('i', [(clock[i + 1] - clock[i]) % (MINUTES_PER_DAY * 60) // 60 for i in range(len(clock) - 1)])
+
+
+def clock_datetime(minutes: int) -> datetime:
+    """The ``datetime`` strptime would have produced for ``minutes`` past midnight."""
+    return _CLOCK[minutes]
@@ -0,0 +1,66 @@
+"""Reading timetables from files for the offline tools.
+
+A timetable file holds the same fields as the run entry form, one run per
+row:
+
+* ``.csv`` – a header row with ``run_id``, ``section``, ``start``, ``end``,
+  ``stops`` and optionally ``stop_times``. Stops are separated by ``|`` and
+  stop times by ``,`` exactly as in the form.
+* ``.json`` – a list of objects with the same keys (or ``{"runs": [...]}``),
+  where ``stops`` and ``stop_times`` may also be lists.
+"""
+
+import csv
+import json
+import os
+from typing import Iterable, List
+
+from scheduler import Run, RunRow, build_runs
+
+TIMETABLE_SUFFIXES = ('.csv', '.json')
+
+
+def find_timetables(paths: Iterable[str]) -> List[str]:
+    """Timetable files named in ``paths``, searching directories recursively."""
+    found: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                found.extend(os.path.join(directory, name) for name in names
+                             if name.lower().endswith(TIMETABLE_SUFFIXES))
+        else:
+            found.append(path)
+    return sorted(found)
+
+
+def _split(value, separator: str) -> List[str]:
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in (value or '').split(separator) if item.strip()]
+
+
+def _row(record) -> RunRow:
+    stops = _split(record.get('stops'), '|')
+    stop_times = _split(record.get('stop_times'), ',') or None
+    if stop_times is not None and len(stop_times) != len(stops):
+        stop_times = None
+    return (str(record.get('run_id') or '').strip(), str(record.get('start') or ''), str(record.get('end') or ''),
+            stops, str(record.get('section') or 'inbound').strip().lower(), stop_times)
+
+
+def read_rows(path: str) -> List[RunRow]:
+    """Raw run rows of one timetable file; rows without a run ID are dropped."""
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        if isinstance(records, dict):
+            records = records.get('runs', [])
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            records = list(csv.DictReader(f))
+    return [row for row in map(_row, records) if row[0]]
+
+
+def load_runs(path: str) -> List[Run]:
+    """Runs of one timetable file; rows with invalid times are skipped."""
+    return build_runs(read_rows(path))